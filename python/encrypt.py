@@ -9,28 +9,52 @@
 
 from __future__ import annotations
 
+import argparse
 import ast
+import hashlib
+import json
 import os
+import platform
 import shutil
+import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
 from pathlib import Path
-from time import sleep
+from typing import Literal, NamedTuple
+
+# linux下reflink(写时复制)的ioctl请求码
+FICLONE = 0x40049409
+# setup文件输出cythonize耗时所用的标记
+CYTHONIZE_MARKER = '__encrypt_cythonize_seconds__'
 
 
 class RemoveAnnotationsTransformer(ast.NodeTransformer):
 
+    @staticmethod
+    def remove_arguments_annotation(args: ast.arguments):
+        # 移除所有参数的类型注解,包括仅位置参数、普通参数、仅关键字参数、*args及**kwargs
+        for arg in args.posonlyargs + args.args + args.kwonlyargs:
+            arg.annotation = None
+        if args.vararg is not None:
+            args.vararg.annotation = None
+        if args.kwarg is not None:
+            args.kwarg.annotation = None
+
     def visit_FunctionDef(self, node):
         # 移除函数返回值的类型注解
         node.returns = None
 
         # 移除函数参数的类型注解
-        if node.args.args:
-            for arg in node.args.args:
-                arg.annotation = None
+        self.remove_arguments_annotation(node.args)
 
         # 继续遍历函数体内的语句
         return self.generic_visit(node)
 
+    # 异步函数与普通函数处理方式相同
+    visit_AsyncFunctionDef = visit_FunctionDef
+
     def visit_AnnAssign(self, node):
         # 如果是纯类型注解语句(没有赋值),则移除
         if node.value is None:
@@ -45,6 +69,260 @@ class RemoveAnnotationsTransformer(ast.NodeTransformer):
             return new_node
 
 
+def link_file(src: Path, dst: Path, src_stat: os.stat_result = None) -> bool:
+    """
+    ~:将文件同步到目的路径,依次尝试硬链接、reflink及复制,目的文件大小及修改时间与源文件相同时跳过
+
+    硬链接与源文件共享同一份数据,不要直接修改目的路径中的非python文件
+
+    Parameters
+    ----------
+    - src: Path, 源文件
+    - dst: Path, 目的文件
+    - src_stat: os.stat_result = None, 源文件状态,为None时重新获取
+
+    Returns
+    -------
+    - bool, 是否写入了目的文件
+    """
+    if src_stat is None:
+        src_stat = src.stat()
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        pass
+    else:
+        if (dst_stat.st_size, dst_stat.st_mtime_ns) == (
+            src_stat.st_size,
+            src_stat.st_mtime_ns,
+        ):
+            return False
+        dst.unlink()
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        pass
+    try:
+        import fcntl
+
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+    except (ImportError, OSError):
+        shutil.copy2(src, dst)
+    return True
+
+
+class BuildResult(NamedTuple):
+    """
+    一次编译(单个文件或一批文件)的加密结果
+    """
+
+    # 编译的python文件
+    pyfiles: list[Path]
+    # setup文件
+    setup_file: Path
+    # 中间文件目录
+    build_temp: Path
+    returncode: int
+    # 整个编译过程的标准输出和标准错误
+    output: str
+    # 编译失败的文件
+    failed: list[Path]
+    # 编译总耗时,秒
+    seconds: float
+    # cythonize(生成C代码)耗时,秒
+    cythonize_seconds: float
+    # 生成的C代码大小,字节
+    c_sizes: dict[Path, int]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+def build_pyfiles(
+    interpreter_path: Path,
+    pyfiles: list[Path],
+    setup_file: Path,
+    setup_str: str,
+    build_temp: Path,
+    parallel: int = 1,
+) -> BuildResult:
+    """
+    ~:在setup文件所在目录下编译一个或一批python文件,工作目录通过子进程`cwd`指定,不切换全局工作目录
+
+    Parameters
+    ----------
+    - interpreter_path: Path, python解释器路径
+    - pyfiles: list[Path], 要加密的python文件
+    - setup_file: Path, setup文件路径
+    - setup_str: str, setup文件源码
+    - build_temp: Path, 中间文件目录
+    - parallel: int = 1, C编译的并行数
+
+    Returns
+    -------
+    - BuildResult, 加密结果
+    """
+    setup_file.write_text(setup_str, encoding='utf8')
+    args = [
+        str(interpreter_path),
+        setup_file.name,
+        'build_ext',
+        '--inplace',
+        '--build-lib',
+        str(build_temp),
+        '--build-temp',
+        str(build_temp),
+    ]
+    if parallel > 1:
+        args.append(f'--parallel={parallel}')
+    start = time.perf_counter()
+    proc = subprocess.run(
+        args,
+        cwd=setup_file.parent,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+    )
+    seconds = time.perf_counter() - start
+    # 取出setup文件输出的cythonize耗时
+    output_lines = []
+    cythonize_seconds = 0
+    for line in proc.stdout.splitlines(keepends=True):
+        if line.startswith(CYTHONIZE_MARKER):
+            cythonize_seconds = float(line.split()[1])
+        else:
+            output_lines.append(line)
+    failed = [
+        pyfile
+        for pyfile in pyfiles
+        if proc.returncode != 0 or not Encrypt.find_extension(pyfile)
+    ]
+    c_sizes = {}
+    for pyfile in pyfiles:
+        c_file = pyfile.with_suffix('.c')
+        if c_file.exists():
+            c_sizes[pyfile] = c_file.stat().st_size
+    return BuildResult(
+        pyfiles,
+        setup_file,
+        build_temp,
+        proc.returncode,
+        ''.join(output_lines),
+        failed,
+        seconds,
+        cythonize_seconds,
+        c_sizes,
+    )
+
+
+class BuildCache:
+    """
+    编译缓存,以去除注解后的源码、setup.py源码(包含模块名及编译指令)、Cython版本及解释器ABI为键,\
+        缓存编译后的扩展模块,命中时直接复制,跳过cythonize及C编译
+    """
+
+    # 查询解释器Cython版本及ABI的脚本
+    query_script = (
+        'import sys, sysconfig, Cython;'
+        'print(Cython.__version__);'
+        'print(sysconfig.get_config_var("EXT_SUFFIX"));'
+        'print(sys.version)'
+    )
+
+    def __init__(self, cache_dir: Path | str, interpreter_path: Path) -> None:
+        """
+        ~:编译缓存
+
+        Parameters
+        ----------
+        - cache_dir: Path | str, 缓存目录
+        - interpreter_path: Path, 项目所用python解释器路径
+        """
+        self.cache_dir = Path(cache_dir).absolute()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        proc = subprocess.run(
+            [str(interpreter_path), '-c', self.query_script],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise Exception(f'无法获取解释器的Cython版本及ABI信息:\n{proc.stdout}')
+        # Cython版本、扩展模块后缀(包含ABI信息)及解释器版本
+        self.cython_version, self.ext_suffix, self.python_version = (
+            proc.stdout.splitlines()[:3]
+        )
+        # 缓存统计
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def key(self, pyfile: Path, setup_str: str) -> str:
+        """
+        ~:计算缓存键
+
+        Parameters
+        ----------
+        - pyfile: Path, 去除注解后的python文件
+        - setup_str: str, setup.py文件源码
+        """
+        sha = hashlib.sha256()
+        for part in (
+            self.cython_version,
+            self.ext_suffix,
+            self.python_version,
+            setup_str,
+        ):
+            sha.update(part.encode('utf8'))
+            sha.update(b'\0')
+        sha.update(pyfile.read_bytes())
+        return sha.hexdigest()
+
+    def _cache_file(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / (key + self.ext_suffix)
+
+    def restore(self, key: str, pyfile: Path) -> bool:
+        """
+        ~:缓存命中时将扩展模块复制到python文件所在目录,并删除源码文件
+
+        Returns
+        -------
+        - bool, 是否命中
+        """
+        cache_file = self._cache_file(key)
+        if not cache_file.is_file():
+            self.misses += 1
+            return False
+        shutil.copyfile(cache_file, pyfile.with_name(pyfile.stem + self.ext_suffix))
+        pyfile.unlink()
+        self.hits += 1
+        return True
+
+    def store(self, key: str, extension: Path):
+        """
+        ~:将编译后的扩展模块存入缓存
+        """
+        cache_file = self._cache_file(key)
+        cache_file.parent.mkdir(exist_ok=True)
+        # 先写临时文件再替换,避免并行运行时读到不完整的文件
+        tmp_file = cache_file.with_name(f'{cache_file.name}.{os.getpid()}.tmp')
+        shutil.copyfile(extension, tmp_file)
+        os.replace(tmp_file, cache_file)
+        self.stores += 1
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return (
+            f'缓存命中 {self.hits}/{total} ({rate:.0%}), 新增缓存 {self.stores} 个'
+        )
+
+
 class Encrypt:
     '''
     利用cython实现python项目代码加密,保留`'main.py','manage.py'`为入口文件
@@ -53,24 +331,134 @@ class Encrypt:
     # setup.py文件的源码格式
     setup_fmt = r'''
 try:
+    import sys
+    import time
     from distutils.core import setup
+    from distutils.extension import Extension
     from traceback import print_exc
 
     from Cython.Build import cythonize
     if __name__ == '__main__':
-        setup(ext_modules=cythonize('{pyfile_name}', compiler_directives={{'language_level': 3}}))
+        start = time.perf_counter()
+        ext_modules = cythonize(
+            Extension('{module_name}', ['{pyfile_name}'], extra_compile_args={cflags}),
+            compiler_directives={compiler_directives},
+        )
+        print('{marker}', time.perf_counter() - start)
+        setup(ext_modules=ext_modules)
 except:
     print('\n\033[31m', end='')
     print_exc()
     print('\033[0m', end='')
+    sys.exit(1)
         '''
 
+    # 批量编译时setup文件的源码格式
+    batch_setup_fmt = r'''
+try:
+    import sys
+    import time
+    from distutils.core import setup
+    from distutils.extension import Extension
+    from traceback import print_exc
+
+    from Cython.Build import cythonize
+    if __name__ == '__main__':
+        start = time.perf_counter()
+        ext_modules = cythonize(
+            [
+                Extension(name, [source], extra_compile_args=cflags)
+                for name, source, cflags in {modules}
+            ],
+            compiler_directives={compiler_directives},
+            nthreads={nthreads},
+        )
+        print('{marker}', time.perf_counter() - start)
+        setup(ext_modules=ext_modules)
+except:
+    print('\n\033[31m', end='')
+    print_exc()
+    print('\033[0m', end='')
+    sys.exit(1)
+        '''
+
+    # 性能对比脚本,在指定根目录下导入模块,运行模块声明的__benchmarks__函数, \
+    # 以json输出每个函数单次调用的耗时(秒),导入或运行失败时输出错误信息
+    benchmark_script = r'''
+import importlib
+import json
+import sys
+import timeit
+
+root, module_names, repeat = sys.argv[1], json.loads(sys.argv[2]), int(sys.argv[3])
+sys.path.insert(0, root)
+results = {}
+for module_name in module_names:
+    try:
+        module = importlib.import_module(module_name)
+        for name in module.__benchmarks__:
+            timer = timeit.Timer(getattr(module, name))
+            number = timer.autorange()[0]
+            results[f'{module_name}:{name}'] = min(timer.repeat(repeat, number)) / number
+    except Exception as e:
+        results[module_name] = repr(e)
+print(json.dumps(results))
+        '''
+
+    # cython编译指令
+    compiler_directives = {'language_level': 3}
+
+    # 编译配置, directives为cython编译指令,以`# cython:`注释写入源码文件头部, \
+    # cflags/msvc_cflags为gcc(clang)/msvc的C编译参数
+    # - protect: 只加密,与cython默认行为一致
+    # - fast: 开启C编译优化,不改变代码语义
+    # - max: 关闭边界检查、负索引、除零检查并推断C类型,可能改变整数溢出、负数除法等行为, \
+    #   编译结果只适用于当前CPU架构,建议通过overrides只对确认安全的模块使用
+    profiles = {
+        'protect': {
+            'directives': {},
+            'cflags': [],
+            'msvc_cflags': [],
+        },
+        'fast': {
+            'directives': {'emit_code_comments': False},
+            'cflags': ['-O3'],
+            'msvc_cflags': ['/O2'],
+        },
+        'max': {
+            'directives': {
+                'emit_code_comments': False,
+                'boundscheck': False,
+                'wraparound': False,
+                'cdivision': True,
+                'infer_types': True,
+            },
+            'cflags': ['-O3', '-march=native'],
+            'msvc_cflags': ['/O2', '/arch:AVX2'],
+        },
+    }
+
+    # 中间文件目录名
+    build_dir = '.encrypt_build'
+
+    # 加密清单文件名后缀,清单保存在目的路径同级目录下,不写入加密结果
+    manifest_suffix = '.encrypt_manifest.json'
+
     def __init__(
         self,
         src_path: Path | str,
         dst_path: Path | str = None,
         interpreter_path: Path | str = None,
         pylist: list[str | Path] = None,
+        jobs: int = 1,
+        cache_dir: Path | str = None,
+        batch: Literal['file', 'dir', 'tree'] = 'file',
+        exclude_dirs: list[str] = None,
+        report_path: Path | str = None,
+        report_top: int = 20,
+        profile: Literal['protect', 'fast', 'max'] = 'protect',
+        overrides: dict[str, str | dict] = None,
+        benchmark: bool = False,
     ) -> None:
         """
         ~:利用cython实现python项目代码加密,保留`'main.py','manage.py'`为入口文件
@@ -82,7 +470,25 @@ except:
         - interpreter_path: Path | str = None, 项目所用python解释器路径,默认为当前解释器
         - pylist: list[str | Path] = None, 指定项目内要加密的文件,只能使用相对于项目文件夹的相对路径, \
             默认不指定,即加密整个项目
+        - jobs: int = 1, 并行编译的进程数,小于等于0时使用cpu核心数
+        - cache_dir: Path | str = None, 编译缓存目录,源码及编译环境未变化的文件直接使用缓存, \
+            默认不使用缓存
+        - batch: Literal['file', 'dir', 'tree'] = 'file', 编译方式, `file`每个文件单独编译, \
+            `dir`每个目录编译一次, `tree`整个项目编译一次,文件较多时批量编译可省去重复的解释器启动开销
+        - exclude_dirs: list[str] = None, 不复制到目的路径的目录,支持通配符,匹配目录名或相对路径, \
+            如`['.git', '.venv', 'build']`, `__pycache__`始终排除
+        - report_path: Path | str = None, 构建报告(json)路径,包含各阶段及每个文件的耗时、C代码大小、\
+            返回码及缓存命中情况,默认不生成
+        - report_top: int = 20, 报告中列出的最慢文件数
+        - profile: Literal['protect', 'fast', 'max'] = 'protect', 编译配置,见`Encrypt.profiles`
+        - overrides: dict[str, str | dict] = None, 按模块覆盖编译配置,键为相对项目文件夹路径的通配符, \
+            值为编译配置名或`{'directives': {...}, 'cflags': [...]}`,依次合并所有匹配项
+        - benchmark: bool = False, 加密完成后对比纯python与加密后模块的性能, \
+            模块需要声明`__benchmarks__ = ['函数名', ...]`,函数不接收参数
         """
+        # 各阶段耗时,秒
+        self.timings: dict[str, float] = {}
+        start = time.perf_counter()
         # 源码路径
         self.src_path = Path(src_path).absolute()
         # 目的路径,默认为源码根目录下 ${源码目录名}.encrypt
@@ -100,21 +506,74 @@ except:
             self.interpreter_path = Path(sys.executable).absolute()
         else:
             self.interpreter_path = Path(interpreter_path).absolute()
+        # 并行编译的进程数
+        self.jobs = jobs if jobs > 0 else os.cpu_count() or 1
+        if batch not in ('file', 'dir', 'tree'):
+            raise ValueError(f'不支持的编译方式: {batch}')
+        # 编译方式
+        self.batch = batch
+        if profile not in self.profiles:
+            raise ValueError(f'不支持的编译配置: {profile}')
+        # 编译配置
+        self.profile = profile
+        self.overrides = overrides or {}
+        self.benchmark = benchmark
+        # 编译缓存
+        self.cache = (
+            None
+            if cache_dir is None
+            else BuildCache(cache_dir, self.interpreter_path)
+        )
         # 不加密的文件列表
         self.exclude = ['__init__.py', 'setup.py', 'main.py', 'manage.py']
+        # 不复制的目录
+        self.exclude_dirs = ['__pycache__'] + list(exclude_dirs or [])
         # python文件列表
         self.pylist: list[Path] = []
         # __init__文件列表,存在__init__.py文件时无法使用cython加密
         self.init_file_list: list[Path] = []
+        # 本次需要加密的python文件对应的源文件状态,加密成功后写入清单
+        self.sources: dict[Path, list] = {}
+        # 加密清单路径,目的路径同级的隐藏文件 .${目的目录名}.encrypt_manifest.json
+        self.manifest_file = self.dst_path.with_name(
+            '.' + self.dst_path.name + self.manifest_suffix
+        )
+        # 上次加密的清单,源文件未变化且扩展模块存在的文件不再重新加密
+        self.manifest = self.load_manifest()
+        # 待移除注解的文件,(源文件, 目的文件)
+        self.strip_list: list[tuple[Path, Path, str]] = []
+        # 未变化而跳过的文件数
+        self.skipped = 0
+        # 构建报告
+        self.report_path = None if report_path is None else Path(report_path).absolute()
+        self.report_top = report_top
+        # 每个文件的编译记录
+        self.records: list[dict] = []
+        stage_start = time.perf_counter()
         if pylist is None:
             self.not_specified_pylist()
         else:
             self.specified_pylist(pylist)
+        self.timings['stage'] = time.perf_counter() - stage_start
+        # 移除注解
+        stage_start = time.perf_counter()
+        self.strip_annotations()
+        self.timings['strip'] = time.perf_counter() - stage_start
         # 开始加密
         self.start_encrypt()
+        # 性能对比
+        self.benchmarks: list[dict] = []
+        if self.benchmark:
+            stage_start = time.perf_counter()
+            self.run_benchmarks()
+            self.timings['benchmark'] = time.perf_counter() - stage_start
+        self.timings['total'] = time.perf_counter() - start
+        self.print_timings()
+        if self.report_path is not None:
+            self.write_report()
 
     @staticmethod
-    def remove_annotation(path_src: Path, path_dst: Path):
+    def remove_annotation(path_src: Path, path_dst: Path, header: str = ''):
         # 读取python源码
         code_str = path_src.read_text(encoding='utf8')
         # 解析代码字符串,得到AST
@@ -125,8 +584,8 @@ except:
         modified_tree = transformer.visit(tree)
         # 将修改后的AST转换回代码字符串
         cleaned_code = ast.unparse(modified_tree)
-        # 重新写入无注解的源码
-        path_dst.write_text(cleaned_code, encoding='utf8')
+        # 重新写入无注解的源码,header为写入文件头部的内容,如cython编译指令注释
+        path_dst.write_text(header + cleaned_code, encoding='utf8')
 
     def specified_pylist(self, pylist: list[Path | str]):
         """
@@ -142,112 +601,629 @@ except:
             # 处理文件
             if item_src.is_file():
                 # 如果文件父目录不存在则创建
-                if not item.parent.exists():
-                    item.parent.mkdir(parents=True)
-                # 复制文件并移除注解
-                shutil.copyfile(item_src, item)
-                Encrypt.remove_annotation(item, item)
-                # 将__init__.py文件重命名为__init__.py.not_encrypt,后续恢复原名
-                if '__init__.py' in item.parent.iterdir():
+                item.parent.mkdir(parents=True, exist_ok=True)
+                # 将同目录的__init__.py文件重命名为__init__.py.not_encrypt,后续恢复原名
+                init_file = item.parent / '__init__.py'
+                if init_file.exists():
                     new_name = item.parent / '__init__.py.not_encrypt'
-                    item.rename(new_name)
+                    init_file.rename(new_name)
                     self.init_file_list.append(new_name)
-                else:
-                    self.pylist.append(item)
+                # 移除注解后直接写入目的路径,由strip_annotations并行处理
+                self.stage_py(item_src, item, item_src.stat())
             else:
-                if item.exists():
-                    shutil.rmtree(item)
-                # 等待删除结束
-                sleep(1)
-                shutil.copytree(item_src, item)
-                self.search_py(item)
+                self.stage(item_src, item)
+
+    def strip_annotations(self):
+        """
+        ~:多进程并行移除注解,每个文件只读取源文件一次、写入目的文件一次
+        """
+        if not self.strip_list:
+            return
+        if self.jobs == 1 or len(self.strip_list) == 1:
+            for src, dst, header in self.strip_list:
+                Encrypt.remove_annotation(src, dst, header)
+        else:
+            srcs, dsts, headers = zip(*self.strip_list)
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                # 文件较多时分块提交,减少进程间通信次数
+                chunksize = max(1, len(self.strip_list) // (self.jobs * 4))
+                list(
+                    executor.map(
+                        Encrypt.remove_annotation,
+                        srcs,
+                        dsts,
+                        headers,
+                        chunksize=chunksize,
+                    )
+                )
+        self.strip_list.clear()
 
     def not_specified_pylist(self):
-        # 如果目的路径存在则删除
-        if self.dst_path.exists():
-            shutil.rmtree(self.dst_path)
-        # 等待删除结束
-        sleep(1)
-        # 拷贝源码,后续处理在此拷贝的文件夹中进行
-        shutil.copytree(self.src_path, self.dst_path)
-        # 检索python文件
-        self.search_py(self.dst_path)
+        # 将源码同步到目的路径,后续处理在目的路径中进行
+        self.stage(self.src_path, self.dst_path)
+
+    def is_excluded(self, src_dir: Path) -> bool:
+        """
+        ~:目录是否排除
+        """
+        relative = src_dir.relative_to(self.src_path).as_posix()
+        return any(
+            fnmatch(src_dir.name, pattern) or fnmatch(relative, pattern)
+            for pattern in self.exclude_dirs
+        )
+
+    def stage(self, src_dir: Path, dst_dir: Path):
+        """
+        ~:遍历一次源码目录,将源码同步到目的路径: python文件由`strip_annotations`移除注解后直接写入, \
+            其他文件使用硬链接或复制,目的路径中多余的文件会被删除
+
+        Parameters
+        ----------
+        - src_dir: Path, 源码目录
+        - dst_dir: Path, 目的目录
+        """
+        stack = [(src_dir, dst_dir)]
+        while stack:
+            src, dst = stack.pop()
+            dst.mkdir(parents=True, exist_ok=True)
+            # 目的目录中应保留的文件名及python文件名(不含后缀)
+            expected: set[str] = set()
+            stems: set[str] = set()
+            with os.scandir(src) as entries:
+                for entry in entries:
+                    item_src = Path(entry.path)
+                    if entry.is_dir():
+                        # 排除的目录不复制,缓存的字节码(__pycache__)可以很轻易反编译为源码,一定不能复制
+                        if not self.is_excluded(item_src):
+                            expected.add(entry.name)
+                            stack.append((item_src, dst / entry.name))
+                    elif entry.name == '__init__.py':
+                        # 存在__init__.py文件时windows下无法正常加密,linux下加密后导入会出现问题, \
+                        # 所以先以__init__.py.not_encrypt名称写入,后续会改回来
+                        expected.update(('__init__.py', '__init__.py.not_encrypt'))
+                        new_name = dst / '__init__.py.not_encrypt'
+                        if (dst / '__init__.py').exists():
+                            (dst / '__init__.py').unlink()
+                        link_file(item_src, new_name, entry.stat())
+                        self.init_file_list.append(new_name)
+                    elif entry.name.endswith('.py') and entry.name not in self.exclude:
+                        expected.add(entry.name)
+                        stems.add(entry.name[:-3])
+                        self.stage_py(item_src, dst / entry.name, entry.stat())
+                    else:
+                        expected.add(entry.name)
+                        link_file(item_src, dst / entry.name, entry.stat())
+            # 删除目的目录中源码已不存在的文件
+            with os.scandir(dst) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if name in expected or (
+                        name.endswith(('.so', '.pyd')) and name.split('.')[0] in stems
+                    ):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+
+    def stage_py(self, src: Path, dst: Path, src_stat: os.stat_result):
+        """
+        ~:源文件未变化且已加密时跳过,否则加入移除注解列表及加密列表
+
+        Parameters
+        ----------
+        - src: Path, 源文件
+        - dst: Path, 目的文件
+        - src_stat: os.stat_result, 源文件状态
+        """
+        record = [
+            src_stat.st_size,
+            src_stat.st_mtime_ns,
+            hashlib.sha1(self.cache_signature(dst).encode('utf8')).hexdigest(),
+        ]
+        relative = dst.relative_to(self.dst_path).as_posix()
+        if (
+            self.manifest.get(relative) == record
+            and not dst.exists()
+            and Encrypt.find_extension(dst)
+        ):
+            self.skipped += 1
+            return
+        # 删除旧的扩展模块,加密失败时回退到新源码,而不是优先导入的旧扩展模块
+        for extension in Encrypt.find_extension(dst):
+            extension.unlink()
+        # cython加密最好移除类型注解,因为如果如果实际类型与类型注解不同,加密后代码运行时会报错
+        self.strip_list.append((src, dst, self.directives_header(dst)))
+        self.pylist.append(dst)
+        self.sources[dst] = record
+
+    def load_manifest(self) -> dict[str, list]:
+        """
+        ~:读取上次加密的清单,解释器不同时清单无效
+        """
+        try:
+            manifest = json.loads(self.manifest_file.read_text(encoding='utf8'))
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('interpreter') != str(self.interpreter_path):
+            return {}
+        return manifest.get('files', {})
+
+    def save_manifest(self, failed: list[Path]):
+        """
+        ~:写入加密清单,加密失败的文件不写入
+        """
+        for pyfile, record in self.sources.items():
+            relative = pyfile.relative_to(self.dst_path).as_posix()
+            if pyfile in failed:
+                self.manifest.pop(relative, None)
+            else:
+                self.manifest[relative] = record
+        self.manifest_file.write_text(
+            json.dumps(
+                {'interpreter': str(self.interpreter_path), 'files': self.manifest}
+            ),
+            encoding='utf8',
+        )
 
     def start_encrypt(self):
         pyfile_count = len(self.pylist)
-        print(f'\n\033[33m{"-*-"*30}\033[0m', f'开始加密 {pyfile_count} 个文件')
-        for i, pyfile in enumerate(self.pylist, start=1):
-            setup_str = self.setup_fmt.format_map(
-                {
-                    'pyfile_name': pyfile.name,
-                }
-            )
-            setup_file = pyfile.parent / 'setup.py'
-            setup_file.write_text(setup_str, encoding='utf8')
-            # 切换到要加密文件的根目录
-            os.chdir(setup_file.parent)
-            # 执行加密
-            os.system(fr"{self.interpreter_path} setup.py build_ext --inplace")
-            # 清理中间文件及源码文件
-            self.clean(pyfile)
-            # 每个文件加密输出的分界线
-            print(f'\033[36m{"-*-"*30}\033[0m', f'{i}/{pyfile_count} 已完成')
-            # 将__init__.py文件恢复原名
+        print(
+            f'\n\033[33m{"-*-"*30}\033[0m',
+            f'开始加密 {pyfile_count} 个文件, 并行数 {self.jobs}'
+            + (f', 未变化跳过 {self.skipped} 个' if self.skipped else ''),
+        )
+        failed: list[BuildResult] = []
+        # 缓存键
+        cache_keys: dict[Path, str] = {}
+        # 需要编译的文件
+        build_list: list[Path] = []
+        i = 0
+        stage_start = time.perf_counter()
+        for pyfile in self.pylist:
+            if self.cache is not None:
+                cache_keys[pyfile] = self.cache.key(pyfile, self.cache_signature(pyfile))
+                if self.cache.restore(cache_keys[pyfile], pyfile):
+                    self.records.append(
+                        {
+                            'path': pyfile.relative_to(self.dst_path).as_posix(),
+                            'cached': True,
+                            'ok': True,
+                        }
+                    )
+                    i += 1
+                    print(
+                        f'\033[36m{"-*-"*30}\033[0m',
+                        f'{i}/{pyfile_count} 已完成',
+                        pyfile.relative_to(self.dst_path),
+                        '(缓存)',
+                    )
+                    continue
+            build_list.append(pyfile)
+        self.timings['cache'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
+        clean_seconds = 0
+        units = self.build_units(build_list)
+        with ThreadPoolExecutor(max_workers=min(self.jobs, len(units) or 1)) as executor:
+            # 编译在子进程中进行,线程只负责等待子进程结束,并发数即编译进程数
+            futures = [
+                executor.submit(build_pyfiles, self.interpreter_path, *unit)
+                for unit in units
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                if self.cache is not None:
+                    for pyfile in result.pyfiles:
+                        if pyfile not in result.failed:
+                            self.cache.store(
+                                cache_keys[pyfile], Encrypt.find_extension(pyfile)[0]
+                            )
+                # 清理中间文件,加密失败时保留源码文件
+                clean_start = time.perf_counter()
+                self.clean(result)
+                clean_seconds += time.perf_counter() - clean_start
+                self.records.extend(self.build_records(result))
+                if not result.ok:
+                    failed.append(result)
+                # 一次编译的输出整体打印,避免并行时输出交错
+                print(result.output, end='')
+                # 每个文件加密输出的分界线
+                for pyfile in result.pyfiles:
+                    i += 1
+                    print(
+                        f'\033[36m{"-*-"*30}\033[0m',
+                        f'{i}/{pyfile_count} 已完成',
+                        pyfile.relative_to(self.dst_path),
+                        '\033[31m失败\033[0m' if pyfile in result.failed else '',
+                    )
+        self.timings['build'] = time.perf_counter() - stage_start - clean_seconds
         print(f'\n\033[36m处理中...\033[0m')
+        stage_start = time.perf_counter()
+        self.save_manifest([pyfile for result in failed for pyfile in result.failed])
+        # 将__init__.py文件恢复原名
         for init_file in self.init_file_list:
             init_file.rename(init_file.parent / '__init__.py')
-        print(f'\n\033[32m加密完成!\033[0m')
+        self.timings['cleanup'] = clean_seconds + time.perf_counter() - stage_start
+        if self.cache is not None:
+            print(f'\n\033[36m{self.cache.summary()}\033[0m')
+        if failed:
+            failed_count = sum(len(result.failed) for result in failed)
+            print(f'\n\033[31m{failed_count} 个文件加密失败,已保留源码:\033[0m')
+            for result in failed:
+                for pyfile in result.failed:
+                    print(
+                        f'\033[31m  {pyfile.relative_to(self.dst_path)}'
+                        f' (返回码 {result.returncode})\033[0m'
+                    )
+        else:
+            print(f'\n\033[32m加密完成!\033[0m')
 
-    def search_py(self, folder: Path):
+    def run_benchmarks(self, repeat: int = 5):
         """
-        ~:递归搜索python文件,并处理
+        ~:分别在源码目录及目的目录导入本次加密成功且声明了`__benchmarks__`的模块,对比纯python与加密后的性能
 
         Parameters
         ----------
+        - repeat: int = 5, 每个函数重复测试的次数,取最小值
         """
+        module_names = []
+        for record in self.records:
+            if not record['ok']:
+                continue
+            src = self.src_path / record['path']
+            if '__benchmarks__' in src.read_text(encoding='utf8'):
+                module_names.append('.'.join(Path(record['path']).with_suffix('').parts))
+        if not module_names:
+            return
+        results = {}
+        for kind, root in (('python', self.src_path), ('compiled', self.dst_path)):
+            proc = subprocess.run(
+                [
+                    str(self.interpreter_path),
+                    '-c',
+                    self.benchmark_script,
+                    str(root),
+                    json.dumps(module_names),
+                    str(repeat),
+                ],
+                cwd=root,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors='replace',
+            )
+            try:
+                results[kind] = json.loads(proc.stdout.splitlines()[-1])
+            except (IndexError, ValueError):
+                print(f'\n\033[31m性能对比失败:\n{proc.stdout}\033[0m')
+                return
+        print('\n\033[36m性能对比(单次调用耗时):\033[0m')
+        for name, python_seconds in results['python'].items():
+            # 模块导入失败时错误信息以模块名为键
+            compiled_seconds = results['compiled'].get(name)
+            if compiled_seconds is None:
+                compiled_seconds = results['compiled'].get(
+                    name.split(':')[0], '加密后模块无测试结果'
+                )
+            if isinstance(python_seconds, str) or isinstance(compiled_seconds, str):
+                error = (
+                    python_seconds if isinstance(python_seconds, str) else compiled_seconds
+                )
+                self.benchmarks.append({'name': name, 'error': error})
+                print(f'\033[31m  {name}: {error}\033[0m')
+                continue
+            speedup = python_seconds / compiled_seconds
+            self.benchmarks.append(
+                {
+                    'name': name,
+                    'python_seconds': python_seconds,
+                    'compiled_seconds': compiled_seconds,
+                    'speedup': speedup,
+                }
+            )
+            # 加密后变慢时标红
+            color = '\033[32m' if speedup >= 1 else '\033[31m'
+            print(
+                f'{color}  {name}: python {python_seconds * 1e6:.2f}us,'
+                f' 加密后 {compiled_seconds * 1e6:.2f}us, 加速比 {speedup:.2f}\033[0m'
+            )
 
-        for item in folder.iterdir():
-            if item.is_file():
-                # 存在__init__.py文件时windows下无法正常加密,linux下加密后导入会出现问题, \
-                # 所以先重命名,后续会改回来
-                if item.name == '__init__.py':
-                    new_name = item.parent / '__init__.py.not_encrypt'
-                    item.rename(new_name)
-                    self.init_file_list.append(new_name)
-                elif item.name in self.exclude:
-                    continue
-                elif item.suffix == '.py':
-                    # cython加密最好移除类型注解,因为如果如果实际类型与类型注解不同,加密后代码运行时会报错
-                    Encrypt.remove_annotation(item, item)
-                    self.pylist.append(item)
-            # 删除缓存的字节码,.pyc文件可以很轻易反编译为源码,如果要加密,该字节码文件一定要删除
-            elif item.name == '__pycache__':
-                shutil.rmtree(item)
-            # 递归查找
-            else:
-                self.search_py(item)
+    def build_records(self, result: BuildResult) -> list[dict]:
+        """
+        ~:一次编译中每个文件的编译记录,批量编译时耗时为整批的耗时
+        """
+        return [
+            {
+                'path': pyfile.relative_to(self.dst_path).as_posix(),
+                'cached': False,
+                'ok': pyfile not in result.failed,
+                'returncode': result.returncode,
+                'seconds': result.seconds,
+                'cythonize_seconds': result.cythonize_seconds,
+                'compile_seconds': result.seconds - result.cythonize_seconds,
+                'c_size': result.c_sizes.get(pyfile),
+                'batch_size': len(result.pyfiles),
+            }
+            for pyfile in result.pyfiles
+        ]
+
+    def print_timings(self):
+        """
+        ~:打印各阶段耗时
+        """
+        print(
+            '\n\033[36m耗时:\033[0m',
+            ', '.join(
+                f'{stage} {seconds:.2f}s' for stage, seconds in self.timings.items()
+            ),
+        )
+
+    def write_report(self):
+        """
+        ~:写入json格式的构建报告
+        """
+        built = [record for record in self.records if not record['cached']]
+        slowest = sorted(built, key=lambda record: record['seconds'], reverse=True)
+        report = {
+            'src_path': str(self.src_path),
+            'dst_path': str(self.dst_path),
+            'interpreter_path': str(self.interpreter_path),
+            'batch': self.batch,
+            'jobs': self.jobs,
+            'profile': self.profile,
+            'timings': self.timings,
+            'files': self.records,
+            'slowest': slowest[: self.report_top],
+            'skipped': self.skipped,
+            'failed': [record['path'] for record in self.records if not record['ok']],
+            'benchmarks': self.benchmarks,
+            'cache': (
+                None
+                if self.cache is None
+                else {
+                    'hits': self.cache.hits,
+                    'misses': self.cache.misses,
+                    'stores': self.cache.stores,
+                }
+            ),
+        }
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+        self.report_path.write_text(
+            json.dumps(report, ensure_ascii=False, indent=2), encoding='utf8'
+        )
+        print(f'\033[36m构建报告: {self.report_path}\033[0m')
 
-    def clean(self, pyfile: Path):
+    def build_units(
+        self, pyfiles: list[Path]
+    ) -> list[tuple[list[Path], Path, str, Path, int]]:
         """
-        ~:清理中间文件及源码文件
+        ~:按编译方式将python文件划分为多次编译
 
         Parameters
         ----------
+        - pyfiles: list[Path], 要编译的python文件
+
+        Returns
+        -------
+        - list[tuple[list[Path], Path, str, Path, int]], 每次编译的`build_pyfiles`参数: \
+            python文件、setup文件、setup文件源码、中间文件目录、C编译并行数
+        """
+        if not pyfiles:
+            return []
+        if self.batch == 'file':
+            # 每个文件使用独立的setup文件和中间文件目录,同目录下的文件可以并行编译
+            return [
+                (
+                    [pyfile],
+                    pyfile.with_name(pyfile.name + '.setup'),
+                    self.setup_str(pyfile),
+                    pyfile.parent / self.build_dir / pyfile.stem,
+                    1,
+                )
+                for pyfile in pyfiles
+            ]
+        if self.batch == 'dir':
+            groups: dict[Path, list[Path]] = {}
+            for pyfile in pyfiles:
+                groups.setdefault(pyfile.parent, []).append(pyfile)
+        else:
+            groups = {self.dst_path: pyfiles}
+        # 同时编译的目录数与每次编译的线程数之积不超过并行数
+        nthreads = max(1, self.jobs // min(self.jobs, len(groups)))
+        units = []
+        for folder, group in groups.items():
+            modules = [
+                (
+                    self.module_name(pyfile),
+                    pyfile.relative_to(folder).as_posix(),
+                    self.build_options(pyfile)[1],
+                )
+                for pyfile in group
+            ]
+            setup_str = self.batch_setup_fmt.format_map(
+                {
+                    'modules': repr(modules),
+                    'compiler_directives': repr(self.compiler_directives),
+                    'nthreads': nthreads,
+                    'marker': CYTHONIZE_MARKER,
+                }
+            )
+            units.append(
+                (
+                    group,
+                    folder / '.encrypt.setup',
+                    setup_str,
+                    folder / self.build_dir / 'batch',
+                    nthreads,
+                )
+            )
+        return units
+
+    def module_name(self, pyfile: Path) -> str:
+        """
+        ~:python文件编译后的模块名,整个项目一次编译时为相对项目根目录的完整模块名
+        """
+        if self.batch == 'tree':
+            return '.'.join(pyfile.relative_to(self.dst_path).with_suffix('').parts)
+        return pyfile.stem
+
+    def setup_str(self, pyfile: Path) -> str:
+        """
+        ~:生成python文件对应的setup.py源码
+        """
+        return self.setup_fmt.format_map(
+            {
+                'module_name': self.module_name(pyfile),
+                'pyfile_name': pyfile.name,
+                'cflags': repr(self.build_options(pyfile)[1]),
+                'compiler_directives': repr(self.compiler_directives),
+                'marker': CYTHONIZE_MARKER,
+            }
+        )
+
+    def build_options(self, pyfile: Path) -> tuple[dict, list[str]]:
+        """
+        ~:python文件的编译配置,编译配置与所有匹配的overrides依次合并
+
+        Returns
+        -------
+        - tuple[dict, list[str]], cython编译指令及C编译参数
+        """
+        cflags_key = 'msvc_cflags' if sys.platform == 'win32' else 'cflags'
+        relative = pyfile.relative_to(self.dst_path).as_posix()
+        directives = dict(self.profiles[self.profile]['directives'])
+        cflags = list(self.profiles[self.profile][cflags_key])
+        for pattern, override in self.overrides.items():
+            if not fnmatch(relative, pattern):
+                continue
+            if isinstance(override, str):
+                override = self.profiles[override]
+            directives.update(override.get('directives', {}))
+            if cflags_key in override or 'cflags' in override:
+                cflags = list(override.get(cflags_key, override.get('cflags')))
+        return directives, cflags
+
+    def directives_header(self, pyfile: Path) -> str:
         """
-        for path in [
-            'build',
-            pyfile.stem + '.c',
-            pyfile.stem + '.py',
-            'setup.py',
-        ]:
-            path = pyfile.parent / path
+        ~:写入源码文件头部的cython编译指令注释
+        """
+        directives = self.build_options(pyfile)[0]
+        if not directives:
+            return ''
+        return (
+            '# cython: '
+            + ', '.join(f'{key}={value}' for key, value in directives.items())
+            + '\n'
+        )
+
+    def cache_signature(self, pyfile: Path) -> str:
+        """
+        ~:除源码外影响编译结果的内容,即单文件setup.py源码(包含模块名、编译指令及C编译参数) \
+            及源码头部的编译指令,针对当前CPU编译时还包括机器信息
+        """
+        signature = f'{self.setup_str(pyfile)}\0{self.directives_header(pyfile)}'
+        cflags = self.build_options(pyfile)[1]
+        if any('native' in flag or 'arch' in flag for flag in cflags):
+            signature += '\0'.join(
+                ['', platform.node(), platform.machine(), platform.processor()]
+            )
+        return signature
+
+    @staticmethod
+    def find_extension(pyfile: Path) -> list[Path]:
+        """
+        ~:查找python文件编译后的扩展模块(.so/.pyd)
+        """
+        return [
+            path
+            for path in pyfile.parent.glob(pyfile.stem + '.*')
+            if path.suffix in ('.so', '.pyd')
+        ]
+
+    def clean(self, result: BuildResult):
+        """
+        ~:批量清理一次编译的中间文件及源码文件,加密失败的文件保留源码
+
+        Parameters
+        ----------
+        - result: BuildResult, 编译结果
+        """
+        paths = [result.setup_file, result.build_temp]
+        for pyfile in result.pyfiles:
+            paths.append(pyfile.with_suffix('.c'))
+            if pyfile not in result.failed:
+                paths.append(pyfile)
+        for path in paths:
             if path.exists():
                 if path.is_file():
                     path.unlink()
                 else:
                     shutil.rmtree(path)
+        # 中间文件目录为空时删除
+        try:
+            result.build_temp.parent.rmdir()
+        except OSError:
+            pass
+
+
+def shell():
+    parser = argparse.ArgumentParser(description="利用cython实现python项目代码加密")
+    parser.add_argument("src_path", type=str, help="项目源文件路径")
+    parser.add_argument("-o", "--dst_path", type=str, default=None, help="目的路径")
+    parser.add_argument(
+        "-i", "--interpreter_path", type=str, default=None, help="项目所用python解释器路径"
+    )
+    parser.add_argument(
+        "-p", "--pylist", type=str, nargs="+", default=None, help="指定项目内要加密的文件"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="并行编译的进程数,0表示使用cpu核心数"
+    )
+    parser.add_argument("-c", "--cache_dir", type=str, default=None, help="编译缓存目录")
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        default='file',
+        choices=['file', 'dir', 'tree'],
+        help="编译方式,file每个文件单独编译,dir每个目录编译一次,tree整个项目编译一次",
+    )
+    parser.add_argument("-r", "--report_path", type=str, default=None, help="构建报告路径")
+    parser.add_argument(
+        "--report_top", type=int, default=20, help="构建报告中列出的最慢文件数"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default='protect',
+        choices=list(Encrypt.profiles),
+        help="编译配置,protect只加密,fast开启C编译优化,max同时关闭安全检查",
+    )
+    parser.add_argument(
+        "--benchmark", action="store_true", help="对比纯python与加密后模块的性能"
+    )
+    parser.add_argument(
+        "-e", "--exclude_dirs", type=str, nargs="+", default=None, help="不复制到目的路径的目录"
+    )
+    args = parser.parse_args()
+    Encrypt(
+        src_path=args.src_path,
+        dst_path=args.dst_path,
+        interpreter_path=args.interpreter_path,
+        pylist=args.pylist,
+        jobs=args.jobs,
+        cache_dir=args.cache_dir,
+        batch=args.batch,
+        exclude_dirs=args.exclude_dirs,
+        report_path=args.report_path,
+        report_top=args.report_top,
+        profile=args.profile,
+        benchmark=args.benchmark,
+    )
 
 
 if __name__ == '__main__':
 
     Encrypt(r'./')
+
+    # shell()
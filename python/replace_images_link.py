@@ -1,8 +1,206 @@
 from __future__ import annotations
 
+import argparse
+import hashlib
+import json
+import os
+import posixpath
 import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Literal
+from typing import Callable, Literal
+from urllib.parse import quote, unquote
+
+
+# Markdown 图片链接
+MARKDOWN_IMAGE_PATTERN = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+# 已是绝对地址的链接(含协议或以//开头)
+ABSOLUTE_URL_PATTERN = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*:|//)')
+# 代码块的围栏
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+# 输出格式
+FORMATS = ('markdown', 'html', 'both')
+
+
+def output_paths(file_path: Path, format_: str = 'markdown') -> dict[str, Path]:
+    """
+    ~:替换结果的文件路径,markdown或html为`<文件名>.new<后缀>`, \
+        both时 HTML 链接的结果为`<文件名>.html.new<后缀>`
+
+    Returns:
+    -------
+    dict[str, Path]: 输出格式与文件路径
+    """
+    new_path = file_path.parent / (file_path.stem + '.new' + file_path.suffix)
+    if format_ == 'both':
+        html_path = file_path.parent / (file_path.stem + '.html.new' + file_path.suffix)
+        return {'markdown': new_path, 'html': html_path}
+    return {format_: new_path}
+
+
+def base_url(
+    owner: str, repo: str, proxy: Literal['jsdelivr'] = None, ref: str = 'main'
+) -> str:
+    """
+    ~:图片服务器链接前缀
+
+    Parameters:
+    ----------
+    - ref: str = 'main', 分支名或提交
+    """
+    if proxy is None:
+        return f'https://raw.githubusercontent.com/{owner}/{repo}/{ref}/'
+    elif proxy == 'jsdelivr':
+        return f'https://cdn.jsdelivr.net/gh/{owner}/{repo}@{ref}/'
+    else:
+        raise ValueError("不支持的代理选项")
+
+
+class ImageIndex:
+    """
+    本地 git 仓库中已提交文件的索引,每次运行只读取一次,用于生成固定到提交的链接及检查图片是否存在; \
+        pin为head时所有图片使用 HEAD 的提交,为file时使用最后修改该图片的提交, \
+        图片未修改时链接不变,CDN 及浏览器可以长期缓存
+    """
+
+    def __init__(self, repo_dir: str | Path, pin: Literal['head', 'file'] = 'head'):
+        """
+        ~:图片索引
+
+        Parameters:
+        ----------
+        - repo_dir: str | Path, git 仓库中的任意目录
+        - pin: Literal['head', 'file'] = 'head', 链接固定的提交
+        """
+        if pin not in ('head', 'file'):
+            raise ValueError("不支持的固定方式")
+        self.pin = pin
+        self.root = Path(self._git(repo_dir, 'rev-parse', '--show-toplevel').strip())
+        self.head = self._git(self.root, 'rev-parse', 'HEAD').strip()
+        self.files: set[str] = set(
+            self._git(self.root, 'ls-tree', '-r', '--name-only', '-z', 'HEAD').split('\0')
+        )
+        self.files.discard('')
+        # 文件最后修改的提交
+        self.commits: dict[str, str] = {}
+        if pin == 'file':
+            self._index_commits()
+        # 本次处理中链接使用的提交(图片不存在时为None),及不存在的图片链接
+        self.used: dict[str, str | None] = {}
+        self.missing: list[tuple[str, int, str]] = []
+
+    @staticmethod
+    def _git(cwd: str | Path, *args: str) -> str:
+        return subprocess.run(
+            ['git', '-c', 'core.quotePath=false', *args],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            check=True,
+        ).stdout
+
+    def _index_commits(self):
+        """
+        ~:一次读取提交历史,按时间倒序,文件第一次出现的提交即最后修改的提交,所有文件都找到后停止读取
+        """
+        process = subprocess.Popen(
+            ['git', '-c', 'core.quotePath=false', 'log', '--format=commit %H', '--name-only', 'HEAD'],
+            cwd=self.root,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+        )
+        commit = None
+        try:
+            for line in process.stdout:
+                line = line.rstrip('\n')
+                if line.startswith('commit '):
+                    commit = line[7:]
+                elif line in self.files and line not in self.commits:
+                    self.commits[line] = commit
+                    if len(self.commits) == len(self.files):
+                        break
+        finally:
+            process.kill()
+            process.wait()
+
+    def resolve(self, url: str, file_path: Path) -> str | None:
+        """
+        ~:链接对应的仓库文件,先按相对于仓库根目录查找,再按相对于 Markdown 文件所在目录查找
+
+        Returns:
+        -------
+        str | None: 仓库中的文件路径,不存在或未提交时为None
+        """
+        path = unquote(url.split('#')[0].split('?')[0])
+        candidates = [posixpath.normpath(path.lstrip('/'))]
+        if not path.startswith('/'):
+            file_dir = os.path.relpath(Path(file_path).resolve().parent, self.root)
+            candidates.append(
+                posixpath.normpath(posixpath.join(Path(file_dir).as_posix(), path))
+            )
+        for candidate in candidates:
+            if candidate in self.files:
+                return candidate
+        return None
+
+    def ref_of(self, url: str, file_path: Path) -> str | None:
+        """
+        ~:链接固定的提交,图片不存在或未提交时为None
+        """
+        repo_path = self.resolve(url, file_path)
+        if repo_path is None:
+            return None
+        if self.pin == 'head':
+            return self.head
+        return self.commits.get(repo_path, self.head)
+
+
+def rewrite_line(
+    line: str, resolve: Callable[[str], str | None], format_: str
+) -> tuple[str, str, int]:
+    """
+    ~:替换一行中的图片链接,已是绝对地址的链接不替换
+
+    Parameters:
+    ----------
+    - line: str, 行
+    - resolve: Callable[[str], str | None], 将图片地址转换为服务器链接的函数,返回None时不替换
+    - format_: str, 输出格式
+
+    Returns:
+    -------
+    tuple[str, str, int]: Markdown 结果(format_为html时为None)、 HTML 结果(format_为markdown时为None)、替换的链接数
+    """
+    parts_markdown: list[str] = []
+    parts_html: list[str] = []
+    count = 0
+    position = 0
+    for match in MARKDOWN_IMAGE_PATTERN.finditer(line):
+        alt, url = match.groups()
+        if ABSOLUTE_URL_PATTERN.match(url):
+            continue
+        # 图片地址后可能有标题
+        target, sep, title = url.partition(' ')
+        if (target := resolve(target)) is None:
+            continue
+        count += 1
+        prefix = line[position : match.start()]
+        parts_markdown.append(f'{prefix}![{alt}]({target}{sep}{title})')
+        parts_html.append(f'{prefix}<img src="{target}" alt="{alt}">')
+        position = match.end()
+    if count == 0:
+        return line, line, 0
+    parts_markdown.append(line[position:])
+    parts_html.append(line[position:])
+    return (
+        None if format_ == 'html' else ''.join(parts_markdown),
+        None if format_ == 'markdown' else ''.join(parts_html),
+        count,
+    )
 
 
 def replace_images_link(
@@ -11,51 +209,294 @@ def replace_images_link(
     repo: str,
     proxy: Literal['jsdelivr'] = None,
     html_link: bool = False,
-):
+    format_: Literal['markdown', 'html', 'both'] = None,
+    pin: Literal['head', 'file'] = None,
+    index: ImageIndex = None,
+) -> int:
     """
     ~:替换 Markdown 文件中的图片链接为指定的服务器链接。
 
+    逐行读取并写出,一次读取可同时生成 Markdown 及 HTML 链接的结果,内存占用与文件大小无关; \
+        代码块中的内容及已是绝对地址(如`https://`、`data:`、`//`)的链接不替换; \
+        跨行的图片链接不替换
+
     Parameters:
     ----------
     - file_path: str | Path, 文件路径
     - owner: str, 仓库所有者
     - repo: str, 仓库名
     - proxy: Literal['jsdelivr'] = None, 代理
-    - html_link: bool = False, 是否生成 HTML 链接
+    - html_link: bool = False, 是否生成 HTML 链接,等同于`format_='html'`
+    - format_: Literal['markdown', 'html', 'both'] = None, 输出格式,为None时按html_link确定, \
+        both同时生成两个文件,见output_paths
+    - pin: Literal['head', 'file'] = None, 链接固定到本地 git 仓库的提交(见ImageIndex),为None时使用main分支, \
+        仓库中不存在或未提交的图片不替换并输出提示
+    - index: ImageIndex = None, 图片索引,批量处理时共用,为None时按pin新建
 
     Returns:
     -------
-    None: 该函数会将修改后的内容写入一个新文件。
+    int: 替换的链接数,该函数会将修改后的内容写入新文件。
     """
     file_path = Path(file_path)
-    markdown_image_pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
+    if format_ is None:
+        format_ = 'html' if html_link else 'markdown'
+    elif format_ not in FORMATS:
+        raise ValueError("不支持的输出格式")
 
-    # 读取文件内容
-    with open(file_path, 'r', encoding='utf-8') as file:
-        markdown_text = file.read()
+    # 当前行号
+    lineno = 0
+    if pin is None and index is None:
+        url_prefix = base_url(owner, repo, proxy)
+
+        def resolve(url: str) -> str:
+            return url_prefix + url.lstrip('/')
 
-    if proxy is None:
-        base_url = f'https://raw.githubusercontent.com/{owner}/{repo}/main/'
-    elif proxy == 'jsdelivr':
-        base_url = f'https://cdn.jsdelivr.net/gh/{owner}/{repo}@main/'
     else:
-        raise ValueError("不支持的代理选项")
+        if index is None:
+            index = ImageIndex(file_path.parent, pin)
+        # 按提交缓存链接前缀
+        prefixes: dict[str, str] = {}
+
+        def resolve(url: str) -> str | None:
+            repo_path = index.resolve(url, file_path)
+            if repo_path is None:
+                index.used[url] = None
+                index.missing.append((str(file_path), lineno, url))
+                print(f'图片不存在或未提交: {file_path}:{lineno} {url}')
+                return None
+            ref = index.ref_of(url, file_path)
+            index.used[url] = ref
+            if ref not in prefixes:
+                prefixes[ref] = base_url(owner, repo, proxy, ref)
+            return prefixes[ref] + quote(repo_path, safe='/')
+
+    paths = output_paths(file_path, format_)
+    outputs = {fmt: open(path, 'w', encoding='utf-8') for fmt, path in paths.items()}
+    markdown_file = outputs.get('markdown')
+    html_file = outputs.get('html')
+    count = 0
+    # 当前代码块的围栏,不在代码块中时为None
+    fence = None
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for lineno, line in enumerate(file, 1):
+                if (match := FENCE_PATTERN.match(line)) is not None:
+                    marker = match.group(1)
+                    if fence is None:
+                        fence = marker
+                    elif marker[0] == fence[0] and len(marker) >= len(fence):
+                        fence = None
+                if fence is not None:
+                    markdown_line = html_line = line
+                else:
+                    markdown_line, html_line, n = rewrite_line(line, resolve, format_)
+                    count += n
+                if markdown_file is not None:
+                    markdown_file.write(markdown_line)
+                if html_file is not None:
+                    html_file.write(html_line)
+    finally:
+        for output in outputs.values():
+            output.close()
+    return count
+
+
+# 进程池中共用的图片索引
+_index: ImageIndex = None
+
+
+def _set_index(index: ImageIndex):
+    global _index
+    _index = index
+
+
+def _count_missing(used: dict[str, str | None]) -> int:
+    """
+    ~:不存在的图片数,同一图片的多个链接只计一次
+    """
+    return sum(ref is None for ref in used.values())
+
+
+def _replace_one(
+    file_path: str, record: list | None, options: dict
+) -> tuple[str, list, int | None, int]:
+    """
+    ~:进程池中处理单个文件,内容及选项的哈希与清单一致、链接固定的提交不变且结果文件存在时跳过
+
+    Returns:
+    -------
+    tuple[str, list, int | None, int]: 文件路径、清单记录(哈希及链接固定的提交)、 \
+        替换的链接数(跳过时为None)、不存在的图片数(跳过时按记录中提交为None的链接计算)
+    """
+    file_path = Path(file_path)
+    hasher = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+    hasher.update(file_path.read_bytes())
+    digest = hasher.hexdigest()
+    # 旧清单中的记录只有哈希
+    if isinstance(record, str):
+        record = [record, {}]
+    format_ = options['format_'] or ('html' if options['html_link'] else 'markdown')
+    if (
+        record is not None
+        and record[0] == digest
+        and all(path.exists() for path in output_paths(file_path, format_).values())
+        and all(_index.ref_of(url, file_path) == ref for url, ref in record[1].items())
+    ):
+        return str(file_path), record, None, _count_missing(record[1])
+    if _index is not None:
+        _index.used = {}
+        _index.missing = []
+    links = replace_images_link(file_path, **options, index=_index)
+    if _index is None:
+        return str(file_path), [digest, {}], links, 0
+    return str(file_path), [digest, _index.used], links, _count_missing(_index.used)
+
+
+def replace_images_link_batch(
+    root: str | Path,
+    owner: str,
+    repo: str,
+    proxy: Literal['jsdelivr'] = None,
+    html_link: bool = False,
+    pattern: str = '**/*.md',
+    workers: int = None,
+    manifest_path: str | Path = None,
+    format_: Literal['markdown', 'html', 'both'] = None,
+    pin: Literal['head', 'file'] = None,
+) -> dict[str, int]:
+    """
+    ~:批量替换目录中 Markdown 文件的图片链接,多进程并行处理, \
+        清单中记录每个文件内容及选项的哈希,未修改的文件跳过
+
+    Parameters:
+    ----------
+    - root: str | Path, 目录路径
+    - owner: str, 仓库所有者
+    - repo: str, 仓库名
+    - proxy: Literal['jsdelivr'] = None, 代理
+    - html_link: bool = False, 是否生成 HTML 链接
+    - pattern: str = '**/*.md', 匹配文件的glob模式,`*.new.*`结果文件不处理
+    - workers: int = None, 进程数,默认为cpu核心数,为1时在当前进程中处理
+    - manifest_path: str | Path = None, 清单路径,默认为目录下的`.replace_images_link.json`
+    - format_: Literal['markdown', 'html', 'both'] = None, 输出格式,为None时按html_link确定
+    - pin: Literal['head', 'file'] = None, 链接固定到本地 git 仓库的提交,仓库文件只索引一次, \
+        见ImageIndex;文件未修改但引用的图片有新提交时重新处理
+
+    Returns:
+    -------
+    dict[str, int]: 文件总数、处理的文件数、跳过的文件数、替换的链接数、不存在的图片数
+    """
+    root = Path(root)
+    manifest_path = Path(manifest_path or root / '.replace_images_link.json')
+    manifest: dict[str, list] = {}
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    options = {
+        'owner': owner,
+        'repo': repo,
+        'proxy': proxy,
+        'html_link': html_link,
+        'format_': format_,
+        'pin': pin,
+    }
+    files = [
+        str(path)
+        for path in root.glob(pattern)
+        if path.is_file() and not path.stem.endswith('.new')
+    ]
+    args = [(path, manifest.get(os.path.relpath(path, root)), options) for path in files]
+    index = None if pin is None else ImageIndex(root, pin)
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(files) < 2:
+        _set_index(index)
+        try:
+            results = [_replace_one(*arg) for arg in args]
+        finally:
+            _set_index(None)
+    else:
+        with ProcessPoolExecutor(
+            workers, initializer=_set_index, initargs=(index,)
+        ) as executor:
+            results = list(
+                executor.map(
+                    _replace_one,
+                    *zip(*args),
+                    chunksize=max(1, len(args) // (workers * 4)),
+                )
+            )
+    counts = {'files': len(files), 'rewritten': 0, 'skipped': 0, 'links': 0, 'missing': 0}
+    new_manifest = {}
+    for path, record, links, missing in results:
+        new_manifest[os.path.relpath(path, root)] = record
+        counts['missing'] += missing
+        if links is None:
+            counts['skipped'] += 1
+        else:
+            counts['rewritten'] += 1
+            counts['links'] += links
+    manifest_path.write_text(
+        json.dumps(new_manifest, ensure_ascii=False, indent=1), encoding='utf-8'
+    )
+    return counts
 
-    # 替换图片链接
-    markdown_text_new = re.sub(
-        markdown_image_pattern, fr'![\1]({base_url}\2)', markdown_text
+
+def shell():
+    parser = argparse.ArgumentParser(description="替换 Markdown 文件中的图片链接")
+    parser.add_argument("path", type=str, help="Markdown 文件或目录路径")
+    parser.add_argument("-o", "--owner", type=str, required=True, help="仓库所有者")
+    parser.add_argument("-r", "--repo", type=str, required=True, help="仓库名")
+    parser.add_argument(
+        "--proxy", type=str, default=None, choices=['jsdelivr'], help="代理"
+    )
+    parser.add_argument("--html_link", action="store_true", help="生成 HTML 链接")
+    parser.add_argument(
+        "-f", "--format", type=str, default=None, choices=FORMATS, help="输出格式"
+    )
+    parser.add_argument(
+        "-g", "--pattern", type=str, default='**/*.md', help="目录中匹配文件的glob模式"
     )
-    # 生成 HTML 链接
-    if html_link:
-        html_text = re.sub(
-            markdown_image_pattern, fr'<img src="{base_url}\2" alt="\1">', markdown_text
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数")
+    parser.add_argument("-m", "--manifest_path", type=str, default=None, help="清单路径")
+    parser.add_argument(
+        "--pin",
+        type=str,
+        default=None,
+        choices=['head', 'file'],
+        help="链接固定到本地git仓库的提交,head为HEAD提交,file为图片最后修改的提交",
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if Path(args.path).is_dir():
+        counts = replace_images_link_batch(
+            args.path,
+            args.owner,
+            args.repo,
+            proxy=args.proxy,
+            html_link=args.html_link,
+            pattern=args.pattern,
+            workers=args.workers,
+            manifest_path=args.manifest_path,
+            format_=args.format,
+            pin=args.pin,
         )
-        markdown_text_new = html_text
-
-    # 将修改后的内容写回文件
-    output_file_path = file_path.parent / (file_path.stem + '.new' + file_path.suffix)
-    with open(output_file_path, 'w', encoding='utf-8') as file:
-        file.write(markdown_text_new)
+    else:
+        index = None if args.pin is None else ImageIndex(Path(args.path).parent, args.pin)
+        links = replace_images_link(
+            args.path,
+            args.owner,
+            args.repo,
+            args.proxy,
+            args.html_link,
+            args.format,
+            index=index,
+        )
+        missing = 0 if index is None else _count_missing(index.used)
+        counts = {'files': 1, 'rewritten': 1, 'skipped': 0, 'links': links, 'missing': missing}
+    print(
+        f"文件 {counts['files']} 个, 处理 {counts['rewritten']} 个, "
+        f"跳过 {counts['skipped']} 个, 替换链接 {counts['links']} 个, "
+        f"图片不存在 {counts['missing']} 个, 耗时 {time.perf_counter() - start:.2f}s"
+    )
 
 
 if __name__ == '__main__':
@@ -68,3 +509,5 @@ if __name__ == '__main__':
         'jsdelivr',
         True,
     )
+
+    # shell()
@@ -8,11 +8,55 @@
 """
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import importlib
+import json
+import logging
+import math
 import multiprocessing
-from datetime import datetime, timedelta
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import NamedTuple
 
-from apscheduler.executors.pool import ProcessPoolExecutor
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+    JobEvent,
+    JobExecutionEvent,
+)
+
+from apscheduler.executors.base import BaseExecutor, MaxInstancesReachedError, run_job
+from apscheduler.executors.pool import BasePoolExecutor, ThreadPoolExecutor
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.util import (
+    datetime_to_utc_timestamp,
+    ref_to_obj,
+    utc_timestamp_to_datetime,
+)
+
+try:
+    from apscheduler.executors.base import run_coroutine_job
+except ImportError:
+    # apscheduler < 3.10
+    from apscheduler.executors.base_py3 import run_coroutine_job
 
 
 def job1():
@@ -23,9 +67,16 @@ def job2():
     print('job2')
 
 
+async def job3():
+    await asyncio.sleep(1)
+    print('job3')
+
+
 TASK_DICT: dict = {
     'task1': {
         'switch': True,
+        # 共享执行器模式下该任务组同时运行的作业数上限,不设置则不限制
+        'quota': 2,
         'job1': {
             'switch': True,
             'etc': None,
@@ -37,6 +88,8 @@ TASK_DICT: dict = {
             'max_instances': 3,
             'next_run_time': datetime.now() + timedelta(seconds=3),
             # 'executor': 'process',
+            # 关键作业,负载过高时仍然运行,可使用准入控制保留的名额
+            'priority': 'critical',
         },
         'job2': {
             'switch': True,
@@ -49,6 +102,9 @@ TASK_DICT: dict = {
             'max_instances': 3,
             'next_run_time': datetime.now() + timedelta(seconds=5),
             'executor': 'process',
+            # 令牌桶限速,每秒最多运行rate次,最多连续运行burst次
+            'rate': 0.5,
+            'burst': 1,
         },
     },
     'task2': {
@@ -75,35 +131,1703 @@ TASK_DICT: dict = {
             'max_instances': 3,
             'next_run_time': datetime.now() + timedelta(seconds=10),
         },
+        'job3': {
+            'switch': True,
+            'etc': None,
+            'func': job3,
+            'args': None,
+            'kwargs': None,
+            'trigger': 'interval',
+            'seconds': 5,
+            'max_instances': 3,
+            'next_run_time': datetime.now() + timedelta(seconds=5),
+            # 协程作业在asyncio事件循环中运行
+            'executor': 'asyncio',
+        },
     },
 }
 
 
-def task_run(task_dict: dict[str, str | dict[str]], **kwargs):
+class Rejection(NamedTuple):
+    """
+    作业不能立即提交的原因
+    """
+
+    reason: str
+    # 为True时排队等待名额释放后运行,否则跳过本次运行
+    defer: bool = True
+
+
+class JobGroups:
+    """
+    作业组并发配额,共享执行器模式下每个任务作为一个作业组,组内同时运行的作业数不超过配额, \
+        超过配额的运行排队等待,名额释放后按排队顺序提交,同组作业轮流运行,不会一直被先触发的作业占用
+    """
+
+    def __init__(self) -> None:
+        # 作业组配额
+        self.quotas: dict[str, int] = {}
+        # 作业所属组
+        self.job_groups: dict[str, str] = {}
+        # 作业组正在运行的作业数
+        self.running: dict[str, int] = defaultdict(int)
+        # 等待名额的运行,(执行器, 作业, 计划运行时间, 排队时间),每个作业最多一个
+        self.deferred: deque[tuple[JobGroupsMixin, Job, list[datetime], float]] = deque()
+        self._lock = threading.Lock()
+
+    def add_group(self, group: str, quota: int = None):
+        """
+        ~:添加作业组
+
+        Parameters
+        ----------
+        - group: str, 作业组名
+        - quota: int = None, 作业组同时运行的作业数上限,为None表示不限制
+        """
+        if quota is not None:
+            self.quotas[group] = quota
+
+    def add_job(self, job_id: str, group: str):
+        self.job_groups[job_id] = group
+
+    def _check(self, job: Job) -> Rejection | None:
+        """
+        ~:检查并发名额,调用方负责加锁,返回None时调用方需要接着调用`_take`, \
+            排队的运行释放名额时会再次检查,返回defer为False的原因时该运行按错过运行处理
+        """
+        group = self.job_groups.get(job.id)
+        if group in self.quotas and self.running[group] >= self.quotas[group]:
+            return Rejection(f'作业组 {group} 已达到配额 {self.quotas[group]}')
+        return None
+
+    def _take(self, job: Job):
+        """
+        ~:占用名额,调用方负责加锁
+        """
+        self.running[self.job_groups.get(job.id)] += 1
+
+    def _give_back(self, job_id: str):
+        """
+        ~:归还名额,调用方负责加锁
+        """
+        self.running[self.job_groups.get(job_id)] -= 1
+
+    def _lane(self, job: Job) -> object:
+        """
+        ~:排队顺序的分组,同一分组内按排队顺序运行
+        """
+        return self.job_groups.get(job.id)
+
+    def _can_defer(self, job: Job) -> Rejection | None:
+        """
+        ~:运行能否排队,调用方负责加锁
+        """
+        return None
+
+    def _gate(self, job: Job) -> Rejection | None:
+        """
+        ~:立即运行或排队前检查是否跳过本次运行(如负载、限速),调用方负责加锁, \
+            只在触发时检查一次,排队的运行不再检查,不会因此一直留在队列中
+        """
+        return None
+
+    def admit(
+        self, executor: JobGroupsMixin, job: Job, run_times: list[datetime]
+    ) -> Rejection | None:
+        """
+        ~:作业提交前申请名额,名额不足时排队,同组已有排队的运行时排在其后
+
+        Parameters
+        ----------
+        - executor: JobGroupsMixin, 提交作业的执行器,名额释放后由其提交排队的运行
+        - job: Job, 作业
+        - run_times: list[datetime], 计划运行时间
+
+        Returns
+        -------
+        - Rejection | None, 不能立即提交的原因,为None表示可以提交,defer为True时已排队
+        """
+        lane = self._lane(job)
+        with self._lock:
+            if any(entry[1].id == job.id for entry in self.deferred):
+                return Rejection(f'作业 {job.id} 已有等待名额的运行', False)
+            if any(self._lane(entry[1]) == lane for entry in self.deferred):
+                rejection = Rejection(f'作业组 {self.job_groups.get(job.id)} 已有等待名额的运行')
+            else:
+                rejection = self._check(job)
+            if rejection is not None and rejection.defer:
+                rejection = self._can_defer(job) or rejection
+            if rejection is not None and not rejection.defer:
+                return rejection
+            if (skip := self._gate(job)) is not None:
+                return skip
+            if rejection is None:
+                self._take(job)
+                return None
+            self.deferred.append((executor, job, run_times, time.monotonic()))
+            return rejection
+
+    def release(self, job_id: str) -> tuple[list[tuple], list[tuple[tuple, str]]]:
+        """
+        ~:作业结束后释放名额,按排队顺序取出能够运行的排队运行,组内先排队的不能运行时后面的也不运行, \
+            再次检查时需要跳过的排队运行移出队列,不阻塞同组后面的运行
+
+        Returns
+        -------
+        - tuple[list[tuple], list[tuple[tuple, str]]], 已占用名额的排队运行(执行器, 作业, 计划运行时间, \
+            排队时间),及移出队列的排队运行与原因,均由调用方处理
+        """
+        with self._lock:
+            self._give_back(job_id)
+            ready = []
+            dropped = []
+            blocked = set()
+            for entry in list(self.deferred):
+                lane = self._lane(entry[1])
+                if lane in blocked:
+                    continue
+                rejection = self._check(entry[1])
+                if rejection is None:
+                    self._take(entry[1])
+                    self.deferred.remove(entry)
+                    ready.append(entry)
+                elif not rejection.defer:
+                    self.deferred.remove(entry)
+                    dropped.append((entry, rejection.reason))
+                else:
+                    blocked.add(lane)
+        return ready, dropped
+
+
+class TokenBucket:
+    """
+    令牌桶限速,每秒补充rate个令牌,最多积累burst个
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """
+        ~:取出一个令牌,调用方负责加锁
+
+        Returns
+        -------
+        - bool, 是否取到令牌
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController(JobGroups):
+    """
+    负载感知的作业准入控制,在作业组配额的基础上增加:
+    - 全局并发上限,其中reserved个名额只给关键作业(`'priority': 'critical'`)使用
+    - 作业令牌桶限速(`'rate'`每秒运行次数,`'burst'`最多连续运行次数)
+    - 负载过高(每核1分钟平均负载超过max_load)时暂停普通作业,关键作业不受影响
+
+    超过全局并发上限的运行与超过作业组配额的一样排队,名额释放后按排队顺序运行,关键作业单独排队; \
+        负载过高、超过限速或排队运行数达到max_queue的普通作业跳过本次运行,合并到触发器的下一次运行; \
+        负载及限速只在触发时检查(排队前取出令牌),排队的运行获得名额后直接运行
+    """
+
+    def __init__(
+        self,
+        max_running: int = None,
+        reserved: int = 0,
+        max_load: float = None,
+        max_queue: int = None,
+    ) -> None:
+        """
+        ~:负载感知的作业准入控制
+
+        Parameters
+        ----------
+        - max_running: int = None, 所有作业同时运行(含执行器中排队)的上限,为None表示不限制
+        - reserved: int = 0, max_running中为关键作业保留的名额
+        - max_load: float = None, 每核1分钟平均负载阈值,超过后暂停普通作业,为None表示不检查, \
+            不支持os.getloadavg的系统(windows)不检查
+        - max_queue: int = None, 等待名额(超过max_running或作业组配额)的运行数上限, \
+            达到后普通作业不再排队而是跳过本次运行,为None表示不限制
+        """
+        super().__init__()
+        if max_running is not None and reserved >= max_running:
+            raise ValueError('reserved需小于max_running')
+        self.max_running = max_running
+        self.reserved = reserved
+        self.max_load = max_load
+        self.max_queue = max_queue
+        # 作业令牌桶
+        self.buckets: dict[str, TokenBucket] = {}
+        # 关键作业
+        self.critical: set[str] = set()
+        # 在途作业总数
+        self.total = 0
+        self._cpu_count = multiprocessing.cpu_count()
+        self._load = 0.0
+        self._load_checked = 0.0
+
+    def add_job(
+        self, job_id: str, group: str, rate: float = None, burst: int = 1, priority: str = 'normal'
+    ):
+        """
+        ~:添加作业
+
+        Parameters
+        ----------
+        - job_id: str, 作业id
+        - group: str, 作业组名
+        - rate: float = None, 每秒允许运行的次数,为None表示不限速
+        - burst: int = 1, 令牌桶容量,最多连续运行的次数
+        - priority: str = 'normal', 作业优先级,`'critical'`或`'normal'`
+        """
+        if priority not in ('critical', 'normal'):
+            raise ValueError(f'作业 {job_id} 的priority需为critical或normal')
+        super().add_job(job_id, group)
+        if rate is not None:
+            self.buckets[job_id] = TokenBucket(rate, burst)
+        if priority == 'critical':
+            self.critical.add(job_id)
+        else:
+            self.critical.discard(job_id)
+
+    def load(self) -> float:
+        """
+        ~:每核1分钟平均负载,1秒内重复调用使用缓存值
+        """
+        now = time.monotonic()
+        if now - self._load_checked >= 1:
+            self._load = os.getloadavg()[0] / self._cpu_count
+            self._load_checked = now
+        return self._load
+
+    def _check(self, job: Job) -> Rejection | None:
+        critical = job.id in self.critical
+        if self.max_running is not None:
+            limit = self.max_running if critical else self.max_running - self.reserved
+            if self.total >= limit:
+                return Rejection(f'在途作业数已达到上限 {limit}')
+        return super()._check(job)
+
+    def _gate(self, job: Job) -> Rejection | None:
+        """
+        ~:负载过高时跳过普通作业,超过限速时跳过,限速检查放在最后,通过时已取出令牌
+        """
+        if job.id not in self.critical:
+            if self.max_load is not None and hasattr(os, 'getloadavg'):
+                if (load := self.load()) > self.max_load:
+                    return Rejection(f'每核平均负载 {load:.2f} 超过阈值 {self.max_load}', False)
+        bucket = self.buckets.get(job.id)
+        if bucket is not None and not bucket.take():
+            return Rejection(f'超过限速 {bucket.rate}次/秒', False)
+        return None
+
+    def _lane(self, job: Job) -> object:
+        return self.job_groups.get(job.id), job.id in self.critical
+
+    def _can_defer(self, job: Job) -> Rejection | None:
+        if (
+            self.max_queue is not None
+            and job.id not in self.critical
+            and len(self.deferred) >= self.max_queue
+        ):
+            return Rejection(f'排队运行数已达到上限 {self.max_queue}', False)
+        return None
+
+    def _take(self, job: Job):
+        super()._take(job)
+        self.total += 1
+
+    def _give_back(self, job_id: str):
+        super()._give_back(job_id)
+        self.total -= 1
+
+
+class DeferredJob:
+    """
+    排队后提交的作业,错过运行的宽限时间加上排队时长,其他属性与原作业相同
+    """
+
+    def __init__(self, job: Job, waited: float):
+        self._job = job
+        grace = job.misfire_grace_time
+        self.misfire_grace_time = None if grace is None else grace + waited
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def __str__(self):
+        return str(self._job)
+
+
+class JobGroupsMixin:
+    """
+    执行器混入类,提交作业前检查作业组配额(或准入控制),名额不足时排队,名额释放后提交, \
+        其他原因不能提交时按达到最大实例数处理(跳过本次运行并记录警告)
+    """
+
+    def __init__(self, *args, job_groups: JobGroups, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._job_groups = job_groups
+
+    def submit_job(self, job, run_times):
+        if (rejection := self._job_groups.admit(self, job, run_times)) is not None:
+            if rejection.defer:
+                self._logger.info('%s, 作业 %s 本次运行排队等待', rejection.reason, job.id)
+                return
+            self._logger.warning('%s, 跳过作业 %s 本次运行', rejection.reason, job.id)
+            raise MaxInstancesReachedError(job)
+        try:
+            super().submit_job(job, run_times)
+        except BaseException:
+            self._release(job.id)
+            raise
+
+    def _submit_deferred(self, job: Job, run_times: list[datetime], queued: float):
+        """
+        ~:提交排队后获得名额的运行,排队时长不计入错过运行的时间,提交失败时按错过运行处理; \
+            释放名额可能发生在调度器关闭时(持有作业存储锁并等待执行器线程结束),这里不能访问作业存储
+        """
+        try:
+            super().submit_job(DeferredJob(job, time.monotonic() - queued), run_times)
+        except Exception as exc:
+            self._miss_deferred(job, run_times, f'提交失败: {exc}')
+            self._release(job.id)
+
+    def _miss_deferred(self, job: Job, run_times: list[datetime], reason: str):
+        """
+        ~:排队的运行不再运行,按错过运行处理,调度器已为其分发提交事件
+        """
+        self._logger.warning('作业 %s 排队后%s, 按错过运行处理', job.id, reason)
+        for run_time in run_times:
+            self._scheduler._dispatch_event(
+                JobExecutionEvent(EVENT_JOB_MISSED, job.id, job._jobstore_alias, run_time)
+            )
+
+    def _release(self, job_id: str):
+        """
+        ~:释放名额,提交获得名额的排队运行,移出队列的排队运行按错过运行处理
+        """
+        ready, dropped = self._job_groups.release(job_id)
+        for (executor, job, run_times, _), reason in dropped:
+            executor._miss_deferred(job, run_times, reason)
+        for executor, job, run_times, queued in ready:
+            executor._submit_deferred(job, run_times, queued)
+
+    def _run_job_success(self, job_id, events):
+        # 先减少实例数再释放名额,排队的同一作业不会因达到最大实例数而提交失败
+        super()._run_job_success(job_id, events)
+        self._release(job_id)
+
+    def _run_job_error(self, job_id, exc, traceback=None):
+        super()._run_job_error(job_id, exc, traceback)
+        self._release(job_id)
+
+
+class EventLoopExecutor(BaseExecutor):
+    """
+    在独立线程的asyncio事件循环中运行协程作业,适用于网络、数据库轮询等io密集型作业, \
+        所有协程作业共用一个线程,不再为每个作业占用一个线程或进程
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=f'APScheduler-{alias}', daemon=True
+        )
+        self._thread.start()
+
+    def shutdown(self, wait=True):
+        if self._loop is None:
+            return
+        if wait:
+            # 等待正在运行的协程作业结束
+            asyncio.run_coroutine_threadsafe(self._wait_tasks(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    @staticmethod
+    async def _wait_tasks():
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            try:
+                events = f.result()
+            except BaseException as exc:
+                self._run_job_error(job.id, exc, exc.__traceback__)
+            else:
+                self._run_job_success(job.id, events)
+
+        f = asyncio.run_coroutine_threadsafe(
+            run_coroutine_job(job, job._jobstore_alias, run_times, self._logger.name),
+            self._loop,
+        )
+        f.add_done_callback(callback)
+
+
+def preload_modules(modules: list[str]):
+    """
+    ~:进程执行器工作进程的初始化函数,进程启动时预先导入模块,作业首次运行时不再承担导入开销
+    """
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            logging.getLogger('apscheduler.executors.process').exception(
+                '预加载模块 %s 失败', module
+            )
+
+
+class JobRef(NamedTuple):
+    """
+    工作进程中运行的作业,只包含run_job需要的字段
+    """
+
+    id: str
+    label: str
+    func: object
+    args: tuple
+    kwargs: dict
+    misfire_grace_time: int
+
+    def __str__(self):
+        return self.label
+
+
+@lru_cache(maxsize=None)
+def resolve_ref(ref: str):
+    """
+    ~:根据文本引用(`module:function`)获取函数,每个工作进程只解析一次
+    """
+    return ref_to_obj(ref)
+
+
+def lazy_call(ref: str, *args, **kwargs):
+    """
+    ~:任务文件中作业的实际运行函数,作业首次运行时才在工作进程(线程)中导入`module:function`所在模块
+
+    Parameters
+    ----------
+    - ref: str, 作业函数的文本引用,如`'package.module:function'`
+    - args, kwargs: 作业函数参数
+    """
+    return resolve_ref(ref)(*args, **kwargs)
+
+
+def run_job_ref(
+    job_id: str,
+    job_label: str,
+    jobstore_alias: str,
+    func_ref: str,
+    args: tuple,
+    kwargs: dict,
+    misfire_grace_time: int,
+    run_times: list[datetime],
+    logger_name: str,
+) -> tuple[list, float]:
+    """
+    ~:在工作进程中通过文本引用运行作业,只需传递引用及参数,不再每次序列化整个作业
+
+    Returns
+    -------
+    - tuple[list, float], 调度器事件及工作进程占用的最大内存(MB),无法获取内存时为None
+    """
+    job = JobRef(job_id, job_label, resolve_ref(func_ref), args, kwargs, misfire_grace_time)
+    events = run_job(job, jobstore_alias, run_times, logger_name)
+    try:
+        import resource
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux下单位为KB,macOS下为字节
+        max_rss_mb = max_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    except ImportError:
+        max_rss_mb = None
+    return events, max_rss_mb
+
+
+class WarmProcessPoolExecutor(BasePoolExecutor):
+    """
+    预热的进程执行器,工作进程启动时预先导入指定模块,作业通过文本引用(`module:function`)运行, \
+        工作进程运行指定次数后重建,任一工作进程内存超过上限时重建整个进程池
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 10,
+        preload: list[str] = None,
+        max_tasks_per_child: int = None,
+        max_memory_mb: float = None,
+    ):
+        """
+        ~:预热的进程执行器
+
+        Parameters
+        ----------
+        - max_workers: int = 10, 最大进程数
+        - preload: list[str] = None, 工作进程启动时预先导入的模块
+        - max_tasks_per_child: int = None, 每个工作进程运行的最大作业数,为None表示不限制
+        - max_memory_mb: float = None, 工作进程内存上限(MB),为None表示不限制
+        """
+        self.pool_kwargs = {
+            'mp_context': multiprocessing.get_context('spawn'),
+            'initializer': preload_modules,
+            'initargs': (list(preload or []),),
+        }
+        self.max_tasks_per_child = max_tasks_per_child
+        if max_tasks_per_child is not None and sys.version_info >= (3, 11):
+            self.pool_kwargs['max_tasks_per_child'] = max_tasks_per_child
+        self.max_memory_mb = max_memory_mb
+        # 当前进程池已提交的作业数,python3.11以下用于按次数重建进程池
+        self._submitted = 0
+        pool = concurrent.futures.ProcessPoolExecutor(int(max_workers), **self.pool_kwargs)
+        super().__init__(pool)
+
+    def _recycle(self, pool: concurrent.futures.ProcessPoolExecutor, reason: str):
+        """
+        ~:重建进程池,旧进程池中正在运行的作业结束后其工作进程退出
+        """
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._logger.info('重建进程池: %s', reason)
+            self._pool = pool.__class__(pool._max_workers, **self.pool_kwargs)
+            self._submitted = 0
+        pool.shutdown(wait=False)
+
+    def _do_submit_job(self, job, run_times):
+        pool = self._pool
+
+        def callback(f):
+            exc = f.exception()
+            if exc:
+                self._run_job_error(job.id, exc, exc.__traceback__)
+                return
+            events, max_rss_mb = f.result()
+            if (
+                self.max_memory_mb is not None
+                and max_rss_mb is not None
+                and max_rss_mb > self.max_memory_mb
+            ):
+                self._recycle(pool, f'工作进程内存 {max_rss_mb:.0f}MB 超过上限')
+            self._run_job_success(job.id, events)
+
+        if job.func_ref is None:
+            raise ValueError(f'作业 {job.id} 的函数无法通过文本引用获取,不能在进程执行器中运行')
+        args = (
+            run_job_ref,
+            job.id,
+            str(job),
+            job._jobstore_alias,
+            job.func_ref,
+            tuple(job.args),
+            dict(job.kwargs),
+            job.misfire_grace_time,
+            run_times,
+            self._logger.name,
+        )
+        try:
+            f = pool.submit(*args)
+        except BrokenProcessPool:
+            self._logger.warning('进程池已损坏,重建进程池')
+            self._recycle(pool, '进程池已损坏')
+            pool = self._pool
+            f = pool.submit(*args)
+        f.add_done_callback(callback)
+        self._submitted += 1
+        # python3.11以下不支持max_tasks_per_child,按整个进程池的提交次数近似重建
+        if (
+            self.max_tasks_per_child is not None
+            and 'max_tasks_per_child' not in self.pool_kwargs
+            and self._submitted >= self.max_tasks_per_child * pool._max_workers
+        ):
+            self._recycle(pool, '作业运行次数达到上限')
+
+
+class SharedThreadPoolExecutor(JobGroupsMixin, ThreadPoolExecutor):
+    """
+    检查作业组配额及准入控制的线程执行器,共享模式下所有任务共用
+    """
+
+
+class SharedProcessPoolExecutor(JobGroupsMixin, WarmProcessPoolExecutor):
+    """
+    检查作业组配额及准入控制的进程执行器,共享模式下所有任务共用
+    """
+
+
+class SharedEventLoopExecutor(JobGroupsMixin, EventLoopExecutor):
+    """
+    检查作业组配额及准入控制的asyncio执行器,共享模式下所有任务共用
+    """
+
+
+class Histogram:
+    """
+    直方图,按Prometheus的累计桶方式统计
+    """
+
+    # 默认桶上界,秒
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """
+        ~:各桶的累计数量,最后一项为`+Inf`
+        """
+        result = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class SchedulerMetrics:
+    """
+    调度器指标,通过调度器事件统计每个作业的启动延迟(实际提交时间与计划运行时间之差)、运行耗时 \
+        (提交到结束,包括等待配额及在执行器中排队的时间)、错过运行次数、因达到最大实例数或准入控制而跳过的次数, \
+        以及执行器的运行中作业数、利用率及排队数
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # 作业启动延迟及运行耗时
+        self.start_lag: dict[str, Histogram] = defaultdict(Histogram)
+        self.duration: dict[str, Histogram] = defaultdict(Histogram)
+        # 作业计数
+        self.runs: dict[str, int] = defaultdict(int)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.misfires: dict[str, int] = defaultdict(int)
+        self.skips: dict[str, int] = defaultdict(int)
+        # 已提交未结束的运行,(调度器名, 作业id, 计划运行时间) -> (执行器名, 提交时间, 提交序号)
+        self._pending: dict[tuple, tuple[str, float, int]] = {}
+        # 提交序号及每次提交未结束的运行数
+        self._submissions = 0
+        self._remaining: dict[int, int] = {}
+        # 先于提交事件到达的结束事件,(调度器名, 作业id, 计划运行时间) -> 事件代码
+        self._early: dict[tuple, int] = {}
+        # 执行器正在运行的作业数,(调度器名, 执行器名) -> 数量
+        self.running: dict[tuple[str, str], int] = defaultdict(int)
+        # 调度器
+        self.schedulers: dict[str, BackgroundScheduler] = {}
+        # 作业所用执行器
+        self._job_executors: dict[tuple[str, str], str] = {}
+
+    def attach(self, scheduler: BackgroundScheduler, name: str):
+        """
+        ~:监听调度器事件
+
+        Parameters
+        ----------
+        - scheduler: BackgroundScheduler, 调度器
+        - name: str, 调度器名,作为指标标签
+        """
+        if name in self.schedulers:
+            return
+        self.schedulers[name] = scheduler
+        scheduler.add_listener(
+            lambda event: self._on_event(name, event),
+            EVENT_JOB_SUBMITTED
+            | EVENT_JOB_EXECUTED
+            | EVENT_JOB_ERROR
+            | EVENT_JOB_MISSED
+            | EVENT_JOB_MAX_INSTANCES,
+        )
+
+    def _executor_of(self, name: str, job_id: str) -> str:
+        key = (name, job_id)
+        if key not in self._job_executors:
+            job = self.schedulers[name].get_job(job_id)
+            self._job_executors[key] = 'default' if job is None else job.executor
+        return self._job_executors[key]
+
+    def _on_event(self, name: str, event: JobEvent):
+        now = time.monotonic()
+        job_id = event.job_id
+        if event.code == EVENT_JOB_SUBMITTED:
+            executor = self._executor_of(name, job_id)
+            lag = (
+                datetime.now(timezone.utc) - event.scheduled_run_times[0]
+            ).total_seconds()
+            with self._lock:
+                self.start_lag[job_id].observe(max(lag, 0))
+                self.running[(name, executor)] += 1
+                # 一次提交可能包含多个计划运行时间,全部结束后运行中作业数才减一
+                self._submissions += 1
+                self._remaining[self._submissions] = len(event.scheduled_run_times)
+                for run_time in event.scheduled_run_times:
+                    self._pending[(name, job_id, run_time)] = (
+                        executor,
+                        now,
+                        self._submissions,
+                    )
+                # 调度器在提交后才分发提交事件,很快结束的作业的结束事件可能先到达
+                for run_time in event.scheduled_run_times:
+                    if (code := self._early.pop((name, job_id, run_time), None)) is not None:
+                        self._finish(name, job_id, run_time, code, now)
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            with self._lock:
+                self.skips[job_id] += 1
+        else:
+            with self._lock:
+                if event.code == EVENT_JOB_MISSED:
+                    self.misfires[job_id] += 1
+                else:
+                    self.runs[job_id] += 1
+                    if event.code == EVENT_JOB_ERROR:
+                        self.errors[job_id] += 1
+                key = (name, job_id, event.scheduled_run_time)
+                if key in self._pending:
+                    self._finish(name, job_id, event.scheduled_run_time, event.code, now)
+                else:
+                    self._early[key] = event.code
+
+    def _finish(self, name: str, job_id: str, run_time: datetime, code: int, now: float):
+        """
+        ~:一次运行结束,调用方负责加锁
+        """
+        executor, submitted, submission = self._pending.pop((name, job_id, run_time))
+        if code != EVENT_JOB_MISSED:
+            self.duration[job_id].observe(now - submitted)
+        self._remaining[submission] -= 1
+        if self._remaining[submission] == 0:
+            del self._remaining[submission]
+            self.running[(name, executor)] -= 1
+
+    def pools(self) -> list[dict]:
+        """
+        ~:执行器状态,包括运行中作业数、最大并发数、利用率及排队数
+        """
+        result = []
+        for name, scheduler in self.schedulers.items():
+            for alias, executor in scheduler._executors.items():
+                pool = getattr(executor, '_pool', None)
+                max_workers = getattr(pool, '_max_workers', None)
+                running = self.running.get((name, alias), 0)
+                result.append(
+                    {
+                        'scheduler': name,
+                        'executor': alias,
+                        'running': running,
+                        'max_workers': max_workers,
+                        'utilization': (
+                            min(running / max_workers, 1) if max_workers else None
+                        ),
+                        'queue_depth': (
+                            max(running - max_workers, 0) if max_workers else 0
+                        ),
+                    }
+                )
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        ~:当前指标,供进程内使用
+        """
+        with self._lock:
+            jobs = {}
+            for job_id in set(self.start_lag) | set(self.runs) | set(self.skips) | set(
+                self.misfires
+            ):
+                lag = self.start_lag.get(job_id)
+                duration = self.duration.get(job_id)
+                jobs[job_id] = {
+                    'runs': self.runs.get(job_id, 0),
+                    'errors': self.errors.get(job_id, 0),
+                    'misfires': self.misfires.get(job_id, 0),
+                    'skips': self.skips.get(job_id, 0),
+                    'start_lag_avg': lag.sum / lag.count if lag and lag.count else None,
+                    'duration_avg': (
+                        duration.sum / duration.count
+                        if duration and duration.count
+                        else None
+                    ),
+                }
+        return {'jobs': jobs, 'pools': self.pools()}
+
+    def render_prometheus(self) -> str:
+        """
+        ~:Prometheus文本格式的指标
+        """
+        lines = []
+        with self._lock:
+            for metric, help_, histograms in (
+                ('task_job_start_lag_seconds', '作业启动延迟', self.start_lag),
+                ('task_job_duration_seconds', '作业运行耗时', self.duration),
+            ):
+                lines.append(f'# HELP {metric} {help_}')
+                lines.append(f'# TYPE {metric} histogram')
+                for job_id, histogram in histograms.items():
+                    for bound, count in histogram.cumulative():
+                        lines.append(
+                            f'{metric}_bucket{{job="{job_id}",le="{bound}"}} {count}'
+                        )
+                    lines.append(f'{metric}_sum{{job="{job_id}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{job="{job_id}"}} {histogram.count}')
+            for metric, help_, counter in (
+                ('task_job_runs_total', '作业运行次数', self.runs),
+                ('task_job_errors_total', '作业出错次数', self.errors),
+                ('task_job_misfires_total', '作业错过运行次数', self.misfires),
+                ('task_job_skips_total', '作业因达到最大实例数或准入控制跳过的次数', self.skips),
+            ):
+                lines.append(f'# HELP {metric} {help_}')
+                lines.append(f'# TYPE {metric} counter')
+                for job_id, value in counter.items():
+                    lines.append(f'{metric}{{job="{job_id}"}} {value}')
+        pools = self.pools()
+        for key, help_ in (
+            ('running', '执行器运行中作业数'),
+            ('max_workers', '执行器最大并发数'),
+            ('utilization', '执行器利用率'),
+            ('queue_depth', '执行器排队作业数'),
+        ):
+            metric = f'task_executor_{key}'
+            lines.append(f'# HELP {metric} {help_}')
+            lines.append(f'# TYPE {metric} gauge')
+            for pool in pools:
+                if pool[key] is None:
+                    continue
+                lines.append(
+                    f'{metric}{{scheduler="{pool["scheduler"]}",'
+                    f'executor="{pool["executor"]}"}} {pool[key]}'
+                )
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str | Path):
+        """
+        ~:将指标写入文件,供node_exporter的textfile采集器读取
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(self.render_prometheus(), encoding='utf8')
+        tmp_path.replace(path)
+
+    def serve(self, port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+        """
+        ~:在后台线程启动http服务, `/metrics`返回Prometheus文本格式的指标
+
+        Parameters
+        ----------
+        - port: int, 端口
+        - host: str = '0.0.0.0', 监听地址
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): ...
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class SQLiteJobStore(MemoryJobStore):
+    """
+    基于本地SQLite文件的持久化作业存储,作业在内存中调度,修改在后台线程中合并后批量写入, \
+        高频运行的作业不会因每次写库而成为瓶颈;同时记录作业运行历史
+
+    重启时从文件恢复作业及下次运行时间,已运行过的作业不会重新运行, \
+        错过的作业在`catchup_window`秒内均匀分散运行,避免集中触发;\
+        写入间隔内进程异常退出时,该间隔内的运行可能重复一次
+    """
+
+    _logger = logging.getLogger('apscheduler.jobstores.sqlite')
+
+    def __init__(
+        self,
+        path: str | Path,
+        scope: str = 'default',
+        flush_interval: float = 1,
+        catchup_window: float = 60,
+    ) -> None:
+        """
+        ~:SQLite作业存储
+
+        Parameters
+        ----------
+        - path: str | Path, SQLite文件路径
+        - scope: str = 'default', 作业范围,多个调度器共用一个文件时用于区分各自的作业
+        - flush_interval: float = 1, 批量写入的间隔,秒
+        - catchup_window: float = 60, 错过的作业分散运行的时间窗口,秒
+        """
+        super().__init__()
+        self.path = Path(path)
+        self.scope = scope
+        self.flush_interval = flush_interval
+        self.catchup_window = catchup_window
+        self._conn: sqlite3.Connection = None
+        self._db_lock = threading.Lock()
+        # 待写入的作业id及运行记录
+        self._dirty: set[str] = set()
+        self._history: list[tuple] = []
+        self._dirty_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        # 从文件恢复的下次运行时间
+        self._restored: dict[str, datetime] = None
+
+    def _connect(self):
+        if self._conn is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'scope TEXT, id TEXT, next_run_time REAL, job_state BLOB, '
+            'PRIMARY KEY (scope, id))'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS runs ('
+            'scope TEXT, job_id TEXT, scheduled_run_time REAL, finished_at REAL, '
+            'status TEXT)'
+        )
+        self._conn.commit()
+
+    def restore(self) -> dict[str, datetime]:
+        """
+        ~:读取文件中作业的下次运行时间,已错过的作业在`catchup_window`内按原顺序均匀分散
+
+        Returns
+        -------
+        - dict[str, datetime], 作业id与下次运行时间
+        """
+        if self._restored is not None:
+            return self._restored
+        self._connect()
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT id, next_run_time FROM jobs WHERE scope = ? '
+                'AND next_run_time IS NOT NULL ORDER BY next_run_time',
+                (self.scope,),
+            ).fetchall()
+        now = time.time()
+        overdue = [(job_id, ts) for job_id, ts in rows if ts < now]
+        self._restored = {job_id: ts for job_id, ts in rows if ts >= now}
+        for i, (job_id, _) in enumerate(overdue):
+            self._restored[job_id] = now + self.catchup_window * i / len(overdue)
+        self._restored = {
+            job_id: utc_timestamp_to_datetime(ts) for job_id, ts in self._restored.items()
+        }
+        return self._restored
+
+    def prune(self, job_ids: set[str]):
+        """
+        ~:删除文件中不在job_ids内的作业,需在调度器启动前调用,已删除的作业不会被恢复及运行
+
+        Parameters
+        ----------
+        - job_ids: set[str], 保留的作业id
+        """
+        self._connect()
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT id FROM jobs WHERE scope = ?', (self.scope,)
+            ).fetchall()
+            stale = [job_id for job_id, in rows if job_id not in job_ids]
+            self._conn.executemany(
+                'DELETE FROM jobs WHERE scope = ? AND id = ?',
+                [(self.scope, job_id) for job_id in stale],
+            )
+            self._conn.commit()
+        if self._restored is not None:
+            for job_id in stale:
+                self._restored.pop(job_id, None)
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        restored = self.restore()
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT id, job_state FROM jobs WHERE scope = ?', (self.scope,)
+            ).fetchall()
+        for job_id, job_state in rows:
+            try:
+                state = pickle.loads(job_state)
+                state['next_run_time'] = restored.get(job_id)
+                job = Job.__new__(Job)
+                job.__setstate__(state)
+            except Exception:
+                self._logger.exception('无法恢复作业 %s, 已跳过', job_id)
+                continue
+            job._scheduler = scheduler
+            job._jobstore_alias = alias
+            super().add_job(job)
+        scheduler.add_listener(
+            self._on_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+        )
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop, name=f'APScheduler-{alias}-flush', daemon=True
+        )
+        self._thread.start()
+
+    def _on_event(self, event: JobEvent):
+        if event.job_id not in self._jobs_index:
+            return
+        status = {
+            EVENT_JOB_EXECUTED: 'executed',
+            EVENT_JOB_ERROR: 'error',
+            EVENT_JOB_MISSED: 'missed',
+        }[event.code]
+        with self._dirty_lock:
+            self._history.append(
+                (
+                    self.scope,
+                    event.job_id,
+                    datetime_to_utc_timestamp(event.scheduled_run_time),
+                    time.time(),
+                    status,
+                )
+            )
+
+    def _mark(self, job_id: str):
+        with self._dirty_lock:
+            self._dirty.add(job_id)
+
+    def add_job(self, job):
+        # 提前检查作业能否序列化
+        pickle.dumps(job.__getstate__(), pickle.HIGHEST_PROTOCOL)
+        super().add_job(job)
+        self._mark(job.id)
+
+    def update_job(self, job):
+        super().update_job(job)
+        self._mark(job.id)
+
+    def remove_job(self, job_id):
+        super().remove_job(job_id)
+        self._mark(job_id)
+
+    def remove_all_jobs(self):
+        with self._dirty_lock:
+            self._dirty.update(self._jobs_index)
+        super().remove_all_jobs()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                self._logger.exception('作业写入失败')
+
+    def flush(self):
+        """
+        ~:将修改过的作业及运行记录写入文件,同一作业的多次修改只写入最后的状态
+        """
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+            history, self._history = self._history, []
+        if not dirty and not history:
+            return
+        upserts = []
+        deletes = []
+        for job_id in dirty:
+            job = self.lookup_job(job_id)
+            if job is None:
+                deletes.append((self.scope, job_id))
+            else:
+                upserts.append(
+                    (
+                        self.scope,
+                        job_id,
+                        datetime_to_utc_timestamp(job.next_run_time),
+                        pickle.dumps(job.__getstate__(), pickle.HIGHEST_PROTOCOL),
+                    )
+                )
+        with self._db_lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)', upserts
+            )
+            self._conn.executemany(
+                'DELETE FROM jobs WHERE scope = ? AND id = ?', deletes
+            )
+            self._conn.executemany('INSERT INTO runs VALUES (?, ?, ?, ?, ?)', history)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    def history(self, job_id: str = None, limit: int = 100) -> list[tuple]:
+        """
+        ~:作业运行历史,按结束时间倒序
+
+        Returns
+        -------
+        - list[tuple], (作业id, 计划运行时间, 结束时间, 状态)
+        """
+        self._connect()
+        sql = 'SELECT job_id, scheduled_run_time, finished_at, status FROM runs WHERE scope = ?'
+        params = [self.scope]
+        if job_id is not None:
+            sql += ' AND job_id = ?'
+            params.append(job_id)
+        sql += ' ORDER BY finished_at DESC LIMIT ?'
+        params.append(limit)
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+
+class Coordinator:
+    """
+    多节点协调,基于所有节点共用的SQLite文件(单机多进程,或各节点可访问的存储),提供:
+    - 作业租约:每个作业同一时间只由持有租约的节点调度,其余节点暂停该作业,租约在存活节点间均分, \
+        节点退出时释放租约,失联节点的租约过期后由其他节点接管
+    - 主节点选举:持有主节点租约的节点负责将失联节点未运行完的队列作业放回队列
+    - 工作队列:`'executor': 'queue'`的作业触发时只写入队列,由各节点`serve`启动的工作线程(进程)领取运行, \
+        计算密集型作业可以通过增加节点横向扩展
+
+    租约依赖各节点时钟基本一致,时钟偏差需远小于`lease_ttl`;失联节点正在运行的队列作业会被重新运行
+    """
+
+    _logger = logging.getLogger('apscheduler.coordinator')
+    # 主节点租约名
+    leader_lease = '__leader__'
+
+    def __init__(self, path: str | Path, node_id: str = None, lease_ttl: float = 30) -> None:
+        """
+        ~:多节点协调
+
+        Parameters
+        ----------
+        - path: str | Path, 所有节点共用的SQLite文件路径
+        - node_id: str = None, 节点名,默认为`主机名:进程id`
+        - lease_ttl: float = 30, 租约有效期,秒,每`lease_ttl / 3`秒续约一次
+        """
+        self.path = Path(path)
+        self.node_id = node_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_ttl = lease_ttl
+        self.leader = False
+        self._conn: sqlite3.Connection = None
+        self._db_lock = threading.Lock()
+        self._schedulers: list[BackgroundScheduler] = []
+        # 持有的作业租约及本地记录的到期时间
+        self._leases: dict[str, float] = {}
+        # 因未持有租约而暂停的作业,下次同步时释放租约的作业
+        self._paused: set[str] = set()
+        self._releasing: set[str] = set()
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._pool: concurrent.futures.Executor = None
+
+    def _connect(self):
+        if self._conn is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, seen REAL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS queue ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT, payload BLOB, state TEXT, '
+            'owner TEXT, enqueued_at REAL, started_at REAL, finished_at REAL, error TEXT)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS queue_state ON queue (state, id)')
+
+    @contextmanager
+    def _transaction(self):
+        """
+        ~:写事务,开始时即获取文件写锁,事务内的读写对其他节点是原子的
+        """
+        self._connect()
+        with self._db_lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _claim(self, conn: sqlite3.Connection, name: str, now: float) -> bool:
+        cursor = conn.execute(
+            'INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+            'owner = excluded.owner, expires = excluded.expires '
+            'WHERE leases.owner = excluded.owner OR leases.expires < ?',
+            (name, self.node_id, now + self.lease_ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def attach(self, scheduler: BackgroundScheduler):
+        """
+        ~:由协调器管理调度器中作业的租约,需在调度器启动前调用,立即同步一次,未取得租约的作业先暂停
+        """
+        self._schedulers.append(scheduler)
+        self.sync()
+        if not any(t.name == 'coordinator-sync' for t in self._threads):
+            thread = threading.Thread(target=self._sync_loop, name='coordinator-sync', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.lease_ttl / 3):
+            try:
+                self.sync()
+            except Exception:
+                self._logger.exception('节点 %s 同步租约失败', self.node_id)
+
+    def sync(self):
+        """
+        ~:节点心跳,续约并按存活节点数均分作业租约,取得租约的作业恢复调度,失去租约的作业暂停; \
+            主节点回收失联节点的队列作业
+        """
+        with self._sync_lock:
+            jobs = {job.id: (sch, job) for sch in self._schedulers for job in sch.get_jobs()}
+            now = time.time()
+            try:
+                with self._transaction() as conn:
+                    conn.execute('INSERT OR REPLACE INTO nodes VALUES (?, ?)', (self.node_id, now))
+                    live = conn.execute(
+                        'SELECT node_id FROM nodes WHERE seen >= ?', (now - self.lease_ttl,)
+                    ).fetchall()
+                    share = math.ceil(len(jobs) / len(live))
+                    leases = {
+                        name: (owner, expires)
+                        for name, owner, expires in conn.execute(
+                            'SELECT name, owner, expires FROM leases'
+                        )
+                    }
+                    # 上次同步时已暂停的作业释放租约
+                    conn.executemany(
+                        'DELETE FROM leases WHERE name = ? AND owner = ?',
+                        [(name, self.node_id) for name in self._releasing],
+                    )
+                    owned = sorted(
+                        name
+                        for name in jobs
+                        if name not in self._releasing
+                        and leases.get(name, (None,))[0] == self.node_id
+                    )
+                    free = sorted(
+                        name
+                        for name in jobs
+                        if name not in self._releasing
+                        and (name not in leases or leases[name][1] < now)
+                        and leases.get(name, (None,))[0] != self.node_id
+                    )
+                    keep = owned + free[: max(share - len(owned), 0)]
+                    # 超出均分数量的作业本次续约并暂停,下次同步时释放,避免与接管的节点同时运行
+                    self._releasing = set(keep[share:])
+                    for name in keep:
+                        self._claim(conn, name, now)
+                    self.leader = self._claim(conn, self.leader_lease, now)
+                    if self.leader:
+                        live_nodes = [node_id for node_id, in live]
+                        placeholders = ','.join('?' * len(live_nodes))
+                        requeued = conn.execute(
+                            "UPDATE queue SET state = 'pending', owner = NULL "
+                            f"WHERE state = 'running' AND owner NOT IN ({placeholders})",
+                            live_nodes,
+                        ).rowcount
+                        if requeued:
+                            self._logger.warning('%s 个失联节点的队列作业已放回队列', requeued)
+                        conn.execute(
+                            'DELETE FROM nodes WHERE seen < ?', (now - 10 * self.lease_ttl,)
+                        )
+                self._leases = {name: now + self.lease_ttl for name in keep}
+            except sqlite3.Error:
+                self._logger.exception('节点 %s 续约失败', self.node_id)
+                self.leader = False
+                self._leases = {n: e for n, e in self._leases.items() if e > now}
+            for name, (sch, job) in jobs.items():
+                if name in self._leases and name not in self._releasing:
+                    if name in self._paused:
+                        sch.resume_job(name)
+                        self._paused.discard(name)
+                        self._logger.info('节点 %s 接管作业 %s', self.node_id, name)
+                # 调度器启动前未设置下次运行时间的作业没有next_run_time属性
+                elif getattr(job, 'next_run_time', True) is not None:
+                    sch.pause_job(name)
+                    self._paused.add(name)
+
+    def put(self, job_id: str, func_ref: str, args: tuple = (), kwargs: dict = None) -> int:
+        """
+        ~:作业写入工作队列
+
+        Returns
+        -------
+        - int, 队列作业id
+        """
+        payload = pickle.dumps((func_ref, tuple(args), dict(kwargs or {})))
+        with self._transaction() as conn:
+            return conn.execute(
+                "INSERT INTO queue (job_id, payload, state, enqueued_at) VALUES (?, ?, 'pending', ?)",
+                (job_id, payload, time.time()),
+            ).lastrowid
+
+    def take(self) -> tuple[int, str, tuple[str, tuple, dict]] | None:
+        """
+        ~:领取队列中最早的作业
+
+        Returns
+        -------
+        - tuple[int, str, tuple[str, tuple, dict]] | None, (队列作业id, 作业id, (函数引用, args, kwargs)), \
+            队列为空时为None
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, job_id, payload FROM queue WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE queue SET state = 'running', owner = ?, started_at = ? WHERE id = ?",
+                (self.node_id, time.time(), row[0]),
+            )
+        return row[0], row[1], pickle.loads(row[2])
+
+    def done(self, item_id: int, error: str = None):
+        """
+        ~:队列作业结束
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                'UPDATE queue SET state = ?, finished_at = ?, error = ? WHERE id = ?',
+                ('error' if error else 'done', time.time(), error, item_id),
+            )
+
+    def serve(self, workers: int = None, processes: bool = False, poll_interval: float = 1):
+        """
+        ~:启动队列工作线程,领取并运行队列中的作业
+
+        Parameters
+        ----------
+        - workers: int = None, 同时运行的作业数,默认为cpu核心数
+        - processes: bool = False, 是否在进程池中运行,计算密集型作业设为True
+        - poll_interval: float = 1, 队列为空时的轮询间隔,秒
+        """
+        workers = workers or multiprocessing.cpu_count()
+        if processes:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            self._pool = concurrent.futures.ThreadPoolExecutor(workers, 'coordinator-worker')
+        thread = threading.Thread(
+            target=self._serve_loop,
+            args=(workers, poll_interval),
+            name='coordinator-queue',
+            daemon=True,
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def _serve_loop(self, workers: int, poll_interval: float):
+        slots = threading.BoundedSemaphore(workers)
+
+        def callback(f: concurrent.futures.Future, item_id: int, job_id: str):
+            slots.release()
+            error = None
+            if (exc := f.exception()) is not None:
+                error = f'{type(exc).__name__}: {exc}'
+                self._logger.error('队列作业 %s(%s) 运行失败: %s', item_id, job_id, error)
+            try:
+                self.done(item_id, error)
+            except sqlite3.Error:
+                self._logger.exception('队列作业 %s 状态写入失败', item_id)
+
+        while not self._stop.is_set():
+            if not slots.acquire(timeout=poll_interval):
+                continue
+            try:
+                item = self.take()
+            except sqlite3.Error:
+                self._logger.exception('领取队列作业失败')
+                item = None
+            if item is None:
+                slots.release()
+                self._stop.wait(poll_interval)
+                continue
+            item_id, job_id, (func_ref, args, kwargs) = item
+            f = self._pool.submit(lazy_call, func_ref, *args, **kwargs)
+            f.add_done_callback(lambda f, i=item_id, j=job_id: callback(f, i, j))
+
+    def queue_stats(self) -> dict[str, int]:
+        """
+        ~:各状态的队列作业数
+        """
+        self._connect()
+        with self._db_lock:
+            return dict(self._conn.execute('SELECT state, COUNT(*) FROM queue GROUP BY state'))
+
+    def shutdown(self, wait: bool = True):
+        """
+        ~:停止同步及队列工作线程,释放租约并注销节点
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+        if self._conn is None:
+            return
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM leases WHERE owner = ?', (self.node_id,))
+            conn.execute('DELETE FROM nodes WHERE node_id = ?', (self.node_id,))
+        self._conn.close()
+        self._conn = None
+
+
+class QueueExecutor(BaseExecutor):
+    """
+    工作队列执行器,作业触发时写入协调器的工作队列,由各节点的队列工作线程(进程)运行, \
+        调度器中的作业写入队列即视为运行结束
+    """
+
+    def __init__(self, coordinator: Coordinator):
+        super().__init__()
+        self.coordinator = coordinator
+
+    def _do_submit_job(self, job, run_times):
+        if job.func_ref is None:
+            raise ValueError(f'作业 {job.id} 的函数无法通过文本引用获取,不能写入工作队列')
+        events = []
+        for run_time in run_times:
+            item_id = self.coordinator.put(job.id, job.func_ref, job.args, job.kwargs)
+            events.append(
+                JobExecutionEvent(
+                    EVENT_JOB_EXECUTED, job.id, job._jobstore_alias, run_time, item_id
+                )
+            )
+        self._run_job_success(job.id, events)
+
+
+def load_task_file(path: str | Path) -> dict[str, dict[str]]:
+    """
+    ~:读取任务文件(TOML、YAML、JSON),转换为`task_run`使用的任务字典
+
+    作业的`func`为`'module:function'`文本引用,添加作业时不导入模块,作业首次运行时才导入, \
+        其余键与任务字典一致(`switch`、`etc`、`trigger`及触发器参数、`max_instances`等), \
+        `switch`默认为true,`etc`默认为空,`next_run_time`可以是延迟秒数或ISO格式时间
+
+    ```toml
+    [task1]
+    switch = true
+    quota = 2
+
+    [task1.job1]
+    func = "package.module:job1"
+    trigger = "interval"
+    seconds = 3
+    max_instances = 3
+    next_run_time = 3
+    ```
+
+    Parameters
+    ----------
+    - path: str | Path, 任务文件路径,按后缀(.toml、.yaml/.yml、.json)解析
+
+    Returns
+    -------
+    - dict[str, dict[str]], 任务字典
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            # python3.11以下使用兼容的第三方库tomli
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError('python3.11以下读取TOML任务文件需要安装tomli')
+        with open(path, 'rb') as f:
+            task_dict = tomllib.load(f)
+    elif suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('读取YAML任务文件需要安装pyyaml')
+        with open(path, encoding='utf-8') as f:
+            task_dict = yaml.safe_load(f) or {}
+    elif suffix == '.json':
+        with open(path, encoding='utf-8') as f:
+            task_dict = json.load(f)
+    else:
+        raise ValueError(f'不支持的任务文件格式: {path.suffix}')
+    for task_name, task in task_dict.items():
+        if not isinstance(task, dict):
+            raise ValueError(f'任务 {task_name} 的格式错误')
+        task.setdefault('switch', True)
+        for job_name, job in task.items():
+            # 任务级别的设置
+            if not isinstance(job, dict):
+                continue
+            if not isinstance(job.get('func'), str) or ':' not in job['func']:
+                raise ValueError(f'作业 {task_name}.{job_name} 的func需为`module:function`格式')
+            job.setdefault('switch', True)
+            job.setdefault('etc', None)
+            # 作业函数延迟导入,文本引用作为lazy_call的第一个参数
+            job['args'] = [job.pop('func'), *(job.get('args') or [])]
+            job['func'] = lazy_call
+            next_run_time = job.get('next_run_time')
+            if isinstance(next_run_time, (int, float)):
+                job['next_run_time'] = datetime.now() + timedelta(seconds=next_run_time)
+            elif isinstance(next_run_time, str):
+                job['next_run_time'] = datetime.fromisoformat(next_run_time)
+    return task_dict
+
+
+def task_run(
+    task_dict: dict[str, str | dict[str]] | str | Path,
+    shared: bool = False,
+    thread_workers: int = None,
+    process_workers: int = None,
+    metrics: SchedulerMetrics = None,
+    jobstore_path: str | Path = None,
+    catchup_window: float = 60,
+    preload: list[str] = None,
+    max_tasks_per_child: int = None,
+    max_memory_mb: float = None,
+    admission: AdmissionController = None,
+    coordinator: Coordinator = None,
+    **kwargs,
+) -> dict[str, BackgroundScheduler]:
     """
     ~: 定时任务启动
 
     Parameters
     ----------
-    - task_dict: dict[str, str | dict[str]] ; 任务字典
+    - task_dict: dict[str, str | dict[str]] | str | Path ; 任务字典,或任务文件路径(见`load_task_file`)
+    - shared: bool = False ; 是否所有任务共用一个调度器及一组执行器(线程、进程、asyncio), \
+        为False时每个任务使用独立的调度器及执行器
+        作业设置`'executor': 'process'`时在进程执行器中运行, `'executor': 'asyncio'`时作为协程 \
+        在asyncio事件循环中运行,不设置时在线程执行器中运行
+    - thread_workers: int = None ; 共享模式下线程执行器的最大线程数,默认为`min(32, cpu核心数 + 4)`
+    - process_workers: int = None ; 进程执行器的最大进程数,默认为cpu核心数
+    - metrics: SchedulerMetrics = None ; 调度器指标,不为None时监听所有调度器的事件
+    - jobstore_path: str | Path = None ; SQLite作业存储文件路径,不为None时持久化作业, \
+        重启后沿用保存的下次运行时间,不再使用任务字典中的`next_run_time`,任务字典中已删除的作业会被移除
+    - catchup_window: float = 60 ; 重启时错过的作业分散运行的时间窗口,秒
+    - preload: list[str] = None ; 进程执行器工作进程启动时预先导入的模块,如`['pandas']`
+    - max_tasks_per_child: int = None ; 进程执行器每个工作进程运行的最大作业数,超过后重建工作进程
+    - max_memory_mb: float = None ; 进程执行器工作进程内存上限(MB),超过后重建进程池
+    - admission: AdmissionController = None ; 准入控制(全局并发上限、负载阈值),所有调度器共用, \
+        作业可设置`'rate'`、`'burst'`限速及`'priority': 'critical'`优先运行
+    - coordinator: Coordinator = None ; 多节点协调,不为None时每个作业只由持有租约的节点调度, \
+        作业设置`'executor': 'queue'`时写入工作队列,由各节点`coordinator.serve()`启动的工作线程运行
     - kwargs: add_job里func部分参数
+
+    Returns
+    -------
+    - dict[str, BackgroundScheduler], 任务名与调度器,共享模式下所有任务对应同一个调度器
     """
+    if isinstance(task_dict, (str, Path)):
+        task_dict = load_task_file(task_dict)
+    cpu_count = multiprocessing.cpu_count()
+    if process_workers is None:
+        process_workers = cpu_count
     # 定时任务调度器字典
     scheduler: dict[str, BackgroundScheduler] = {}
+    # 作业组配额及准入控制
+    job_groups = admission if admission is not None else AdmissionController()
+    if shared:
+        shared_scheduler = BackgroundScheduler(
+            timezone='Asia/Shanghai',
+            jobstores=_jobstores('shared', jobstore_path, catchup_window),
+            # 所有任务共享的线程执行器及进程执行器
+            executors={
+                'default': SharedThreadPoolExecutor(
+                    max_workers=thread_workers or min(32, cpu_count + 4),
+                    job_groups=job_groups,
+                ),
+                'process': SharedProcessPoolExecutor(
+                    max_workers=process_workers,
+                    preload=preload,
+                    max_tasks_per_child=max_tasks_per_child,
+                    max_memory_mb=max_memory_mb,
+                    job_groups=job_groups,
+                ),
+                'asyncio': SharedEventLoopExecutor(job_groups=job_groups),
+                **_queue_executor(coordinator),
+            },
+        )
     # 遍历任务字典
     for task_name, task in task_dict.items():
         # 任务调度器开关
         if task.pop('switch'):
-            # 添加任务调度器到字典
-            scheduler[task_name] = BackgroundScheduler(
-                timezone='Asia/Shanghai',
-                # 添加进程执行器
-                executors={
-                    'process': ProcessPoolExecutor(
-                        max_workers=multiprocessing.cpu_count()
-                    )
-                },
-            )
+            # 作业组配额
+            quota = task.pop('quota', None)
+            if shared:
+                job_groups.add_group(task_name, quota)
+                scheduler[task_name] = shared_scheduler
+            else:
+                # 添加任务调度器到字典
+                scheduler[task_name] = BackgroundScheduler(
+                    timezone='Asia/Shanghai',
+                    jobstores=_jobstores(task_name, jobstore_path, catchup_window),
+                    # 添加线程执行器、进程执行器及asyncio执行器,作业组配额只在共享模式下生效
+                    executors={
+                        'default': SharedThreadPoolExecutor(max_workers=10, job_groups=job_groups),
+                        'process': SharedProcessPoolExecutor(
+                            max_workers=process_workers,
+                            preload=preload,
+                            max_tasks_per_child=max_tasks_per_child,
+                            max_memory_mb=max_memory_mb,
+                            job_groups=job_groups,
+                        ),
+                        'asyncio': SharedEventLoopExecutor(job_groups=job_groups),
+                        **_queue_executor(coordinator),
+                    },
+                )
             # 遍历作业字典
             for job_name, job in task.items():
                 job: dict
@@ -117,15 +1841,87 @@ def task_run(task_dict: dict[str, str | dict[str]], **kwargs):
                         else:
                             for e in etc:
                                 job['kwargs'][e] = kwargs[e]
+                    # 作业id,同一调度器内不能重复
+                    job.setdefault('id', f'{task_name}.{job_name}')
+                    # 作业限速及优先级
+                    job_groups.add_job(
+                        job['id'],
+                        task_name,
+                        rate=job.pop('rate', None),
+                        burst=job.pop('burst', 1),
+                        priority=job.pop('priority', 'normal'),
+                    )
+                    if jobstore_path is not None:
+                        # 沿用保存的下次运行时间,并替换保存的作业以应用任务字典中的修改
+                        jobstore = scheduler[task_name]._jobstores['default']
+                        restored = jobstore.restore()
+                        if job['id'] in restored:
+                            job['next_run_time'] = restored[job['id']]
+                        job['replace_existing'] = True
                     # 添加作业到调度器
                     scheduler[task_name].add_job(name=job_name, **job)
             # 任务启动
-            scheduler[task_name].start()
+            if not shared:
+                _prune_jobstore(scheduler[task_name], {job.get('id') for job in task.values()})
+                if metrics is not None:
+                    metrics.attach(scheduler[task_name], task_name)
+                if coordinator is not None:
+                    coordinator.attach(scheduler[task_name])
+                scheduler[task_name].start()
+    if shared:
+        _prune_jobstore(
+            shared_scheduler,
+            {
+                job.get('id')
+                for task_name, task in task_dict.items()
+                if task_name in scheduler
+                for job in task.values()
+            },
+        )
+        if metrics is not None:
+            metrics.attach(shared_scheduler, 'shared')
+        if coordinator is not None:
+            coordinator.attach(shared_scheduler)
+        shared_scheduler.start()
+    return scheduler
 
 
-if __name__ == '__main__':
-    import time
+def _prune_jobstore(scheduler: BackgroundScheduler, job_ids: set[str]):
+    """
+    ~:调度器启动前移除作业存储中任务字典已删除的作业,避免已删除的错过作业在重启时运行一次
+    """
+    jobstore = scheduler._jobstores.get('default')
+    if isinstance(jobstore, SQLiteJobStore):
+        jobstore.prune(job_ids)
+
+
+def _queue_executor(coordinator: Coordinator | None) -> dict[str, QueueExecutor]:
+    """
+    ~:有多节点协调时添加工作队列执行器
+    """
+    return {} if coordinator is None else {'queue': QueueExecutor(coordinator)}
+
+
+def _jobstores(
+    scope: str, jobstore_path: str | Path, catchup_window: float
+) -> dict[str, SQLiteJobStore]:
+    """
+    ~:调度器的作业存储,未指定文件路径时使用默认的内存存储
+    """
+    if jobstore_path is None:
+        return {}
+    return {
+        'default': SQLiteJobStore(
+            jobstore_path, scope=scope, catchup_window=catchup_window
+        )
+    }
 
-    task_run(TASK_DICT)
+
+if __name__ == '__main__':
+    metrics = SchedulerMetrics()
+    task_run(TASK_DICT, metrics=metrics)
+    # task_run(TASK_DICT, admission=AdmissionController(max_running=8, reserved=2, max_load=1.5))
+    # task_run('tasks.toml', metrics=metrics)
+    # metrics.serve(9100)
     while True:
         time.sleep(100)
@@ -1,6 +1,325 @@
 import argparse
+import json
+import os
+import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+
+class TreeNode(NamedTuple):
+    """
+    目录树节点
+    """
+
+    # 路径,根目录为传入的路径,其余为根目录路径与名称的拼接
+    path: str
+    name: str
+    # 根目录为0
+    depth: int
+    # dir或file
+    kind: str
+    # 是否为同级最后一项
+    is_last: bool
+    # 大小及修改时间,stat为False时为None,du模式下目录大小为其下所有文件大小之和
+    size: int = None
+    mtime: float = None
+    # du模式下目录中的文件总数,文件为1,非du模式为None
+    count: int = None
+
+
+class DirListing(NamedTuple):
+    """
+    du模式读取的目录内容,未经过滤,按读取顺序
+    """
+
+    path: str
+    # 目录的修改时间,纳秒
+    mtime_ns: int
+    # 子目录名
+    dirs: list[str]
+    # 文件名及大小
+    files: list[tuple[str, int]]
+
+
+class DuNode:
+    """
+    du模式的目录树节点,汇总大小及文件数
+    """
+
+    __slots__ = ('path', 'name', 'kind', 'size', 'count', 'children')
+
+    def __init__(self, path: str, name: str, kind: str, size: int = 0, count: int = 0) -> None:
+        self.path = path
+        self.name = name
+        self.kind = kind
+        self.size = size
+        self.count = count
+        self.children: list[DuNode] = []
+
+
+class DirLister:
+    """
+    目录读取,workers大于1时用线程池预读即将访问的子目录(读取完成后继续预读其子目录), \
+        同时预读的目录数不超过max_pending,适用于NFS、FUSE等读取延迟高的文件系统; \
+        读取结果按访问顺序取用,输出顺序不变
+    """
+
+    def __init__(
+        self,
+        scandir: Callable[[str], list[os.DirEntry]],
+        workers: int = None,
+        max_pending: int = None,
+        subdirs: Callable[[object], list[str]] = None,
+    ) -> None:
+        """
+        ~:目录读取
+
+        Parameters
+        ----------
+        - scandir: Callable[[str], list[os.DirEntry]], 读取单个目录的函数
+        - workers: int = None, 读取目录的线程数,为None或1时不预读
+        - max_pending: int = None, 预读的最大目录数(含已读取未取用的),默认为workers的8倍
+        - subdirs: Callable[[object], list[str]] = None, 从读取结果中获取子目录路径的函数, \
+            为None表示读取结果为DirEntry列表
+        """
+        self.scandir = scandir
+        self.subdirs = subdirs or (lambda entries: [e.path for e in entries if e.is_dir()])
+        self.pool = ThreadPoolExecutor(workers) if workers and workers > 1 else None
+        self.max_pending = max_pending or 8 * (workers or 1)
+        # 预读完成的回调在持有锁时也可能被立即调用,使用可重入锁
+        self._lock = threading.RLock()
+        self._closed = False
+        # 预读中及已预读未取用的目录
+        self.pending: dict[str, Future] = {}
+        # 等待预读的目录及其剩余深度,最近发现的目录最先访问,排在最前
+        self.waiting: deque[tuple[str, int]] = deque()
+        # 已取用的目录,不再预读
+        self.visited: set[str] = set()
+
+    def prefetch(self, entries, depth: int = None):
+        """
+        ~:登记即将按顺序访问的目录
+
+        Parameters
+        ----------
+        - entries: 目录的读取结果,预读其中的子目录
+        - depth: int = None, 目录项所在层的剩余深度,为None表示不限制
+        """
+        if self.pool is None or self._closed or not (depth is None or depth > 1):
+            return
+        child_depth = None if depth is None else depth - 1
+        with self._lock:
+            self.waiting.extendleft(
+                reversed([(path, child_depth) for path in self.subdirs(entries)])
+            )
+            self._fill()
+
+    def _fill(self):
+        while self.waiting and len(self.pending) < self.max_pending:
+            path, depth = self.waiting.popleft()
+            if path not in self.pending and path not in self.visited:
+                future = self.pool.submit(self.scandir, path)
+                future.add_done_callback(lambda f, d=depth: self._prefetched(f, d))
+                self.pending[path] = future
+
+    def _prefetched(self, future: Future, depth: int):
+        if not future.cancelled() and future.exception() is None:
+            self.prefetch(future.result(), depth)
+
+    def get(self, path: str) -> list[os.DirEntry]:
+        """
+        ~:读取目录,已预读时直接取用结果
+        """
+        with self._lock:
+            self.visited.add(path)
+            future = self.pending.pop(path, None)
+            if future is not None:
+                self._fill()
+        if future is None:
+            return self.scandir(path)
+        return future.result()
+
+    def close(self):
+        if self.pool is not None:
+            with self._lock:
+                self._closed = True
+                self.waiting.clear()
+                for future in self.pending.values():
+                    future.cancel()
+            self.pool.shutdown()
+
+
+def translate_ignore(pattern: str) -> str:
+    """
+    ~:将gitignore格式的模式(不含开头的`!`及结尾的`/`)转换为正则表达式,匹配相对于忽略文件所在目录的路径
+
+    Parameters
+    ----------
+    - pattern: str, 模式,含`/`时相对于所在目录,否则匹配任意一层;`**`匹配任意层目录
+
+    Returns
+    -------
+    - str, 正则表达式
+    """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    regex = [] if anchored else ['(?:.*/)?']
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif c == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif c == '?':
+            regex.append('[^/]')
+            i += 1
+        elif c == '[' and (end := pattern.find(']', i + 2)) != -1:
+            body = pattern[i + 1 : end]
+            if body[0] == '!':
+                body = '^' + body[1:]
+            regex.append(f'[{body}]')
+            i = end + 1
+        elif c == '\\' and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(c))
+            i += 1
+    return ''.join(regex)
+
+
+class IgnoreRules:
+    """
+    一个忽略文件(或--exclude)中的模式,编译为少量正则表达式,最后匹配的模式决定是否忽略
+    """
+
+    def __init__(self, base: str, patterns: Iterable[str]) -> None:
+        """
+        ~:忽略规则
+
+        Parameters
+        ----------
+        - base: str, 模式所在目录,模式匹配相对于该目录的路径
+        - patterns: Iterable[str], gitignore格式的模式,`#`开头为注释,`!`开头为取消忽略,`/`结尾只匹配目录
+        """
+        self.prefix = base if base.endswith(os.sep) else base + os.sep
+        # 连续的同类(忽略或取消忽略)模式合并为一组,每组为(是否取消忽略, 文件及目录的正则, 目录的正则)
+        self.groups: list[tuple[bool, re.Pattern | None, re.Pattern | None]] = []
+        runs: list[tuple[bool, list[str], list[str]]] = []
+        for pattern in patterns:
+            pattern = pattern.rstrip('\n').rstrip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negate = pattern.startswith('!')
+            if negate:
+                pattern = pattern[1:]
+            dir_only = pattern.endswith('/')
+            regex = translate_ignore(pattern.rstrip('/'))
+            if not runs or runs[-1][0] != negate:
+                runs.append((negate, [], []))
+            if not dir_only:
+                runs[-1][1].append(regex)
+            runs[-1][2].append(regex)
+        for negate, any_regex, dir_regex in runs:
+            self.groups.append(
+                (
+                    negate,
+                    re.compile('|'.join(any_regex)) if any_regex else None,
+                    re.compile('|'.join(dir_regex)),
+                )
+            )
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """
+        ~:匹配路径
+
+        Returns
+        -------
+        - bool | None, 是否忽略,没有匹配的模式时为None
+        """
+        if not path.startswith(self.prefix):
+            return None
+        relative = path[len(self.prefix) :]
+        if os.sep != '/':
+            relative = relative.replace(os.sep, '/')
+        for negate, any_regex, dir_regex in reversed(self.groups):
+            regex = dir_regex if is_dir else any_regex
+            if regex is not None and regex.fullmatch(relative):
+                return not negate
+        return None
+
+
+class IgnoreMatcher:
+    """
+    忽略文件(.gitignore、.ignore)及--exclude模式的匹配,目录读取时登记其中的忽略文件, \
+        规则对该目录及其子目录生效,子目录的规则优先,--exclude优先级最高; \
+        被忽略的目录不再读取;只读取遍历范围内的忽略文件
+    """
+
+    ignore_names = ('.gitignore', '.ignore')
+
+    def __init__(self, root: str, exclude: list[str] = None, gitignore: bool = True) -> None:
+        """
+        ~:忽略规则匹配
+
+        Parameters
+        ----------
+        - root: str, 遍历的根目录,--exclude模式相对于该目录
+        - exclude: list[str] = None, gitignore格式的排除模式,如`['node_modules/', '*.pyc', 'build/']`
+        - gitignore: bool = True, 是否读取遍历到的目录中的.gitignore、.ignore文件
+        """
+        self.exclude = IgnoreRules(root, exclude) if exclude else None
+        self.gitignore = gitignore
+        # 目录路径与生效的忽略规则,按优先级从低到高
+        self._rules: dict[str, tuple[IgnoreRules, ...]] = {}
+
+    def enter(self, path: str, file_names: Iterable[str]) -> tuple[IgnoreRules, ...]:
+        """
+        ~:读取目录时登记其中的忽略文件
+
+        Parameters
+        ----------
+        - path: str, 目录路径
+        - file_names: Iterable[str], 目录中的文件名
+
+        Returns
+        -------
+        - tuple[IgnoreRules, ...], 对目录中的项生效的规则
+        """
+        rules = self._rules.get(path)
+        if rules is not None:
+            return rules
+        rules = self._rules.get(os.path.dirname(path), ())
+        if self.gitignore:
+            for name in self.ignore_names:
+                if name in file_names:
+                    with open(
+                        os.path.join(path, name), encoding='utf-8', errors='ignore'
+                    ) as f:
+                        rules = rules + (IgnoreRules(path, f),)
+        self._rules[path] = rules
+        return rules
+
+    def ignored(self, rules: tuple[IgnoreRules, ...], path: str, is_dir: bool) -> bool:
+        """
+        ~:路径是否被忽略
+        """
+        if self.exclude is not None and (result := self.exclude.match(path, is_dir)) is not None:
+            return result
+        for rule in reversed(rules):
+            if (result := rule.match(path, is_dir)) is not None:
+                return result
+        return False
 
 
 class Tree:
@@ -12,6 +331,7 @@ class Tree:
     BLUE = "\033[34m"
     WHITE = "\033[0m"
     YELLOW = "\033[33m"
+    GREY = "\033[90m"
     # 图标
     root_icon = '📦'
     dir_icon = '📁'
@@ -22,51 +342,335 @@ class Tree:
 
     def __init__(self) -> None: ...
 
-    def _print_tree(
+    # 输出缓冲的行数
+    buffer_lines = 4096
+    # 输出格式
+    formats = ('text', 'ndjson', 'json')
+
+    def _scandir(
+        self,
+        path: str,
+        filter_: Callable[[Path], bool] = None,
+        matcher: IgnoreMatcher = None,
+    ) -> list[os.DirEntry]:
+        """
+        ~:读取目录,目录在前,文件在后,使用DirEntry缓存的类型信息,不再逐个stat
+        """
+        dirs: list[os.DirEntry] = []
+        files: list[os.DirEntry] = []
+        with os.scandir(path) as it:
+            entries: Iterable[os.DirEntry] = it
+            if matcher is not None:
+                entries = list(it)
+                rules = matcher.enter(
+                    os.fspath(path), {e.name for e in entries if e.name in matcher.ignore_names}
+                )
+            for entry in entries:
+                if filter_ is not None and not filter_(Path(entry.path)):
+                    continue
+                if entry.is_dir():
+                    if matcher is not None and matcher.ignored(rules, entry.path, True):
+                        continue
+                    dirs.append(entry)
+                elif entry.is_file():
+                    if matcher is not None and matcher.ignored(rules, entry.path, False):
+                        continue
+                    files.append(entry)
+        return dirs + files
+
+    def _listdir(self, lister: DirLister, path: str, depth: int) -> list[os.DirEntry]:
+        """
+        ~:读取目录,子目录需要继续展开时登记预读
+        """
+        entries = lister.get(path)
+        lister.prefetch(entries, depth)
+        return entries
+
+    def iter_tree(
+        self,
+        path: str = None,
+        depth: int = None,
+        filter_: Callable[[Path], bool] = None,
+        workers: int = None,
+        stat: bool = False,
+        exclude: list[str] = None,
+        gitignore: bool = False,
+    ) -> Iterator[TreeNode]:
+        """
+        ~:按输出顺序(深度优先,目录在前,文件在后)逐个生成目录树节点,第一个节点为根目录, \
+            遍历与使用同时进行,内存占用与树的大小无关
+
+        Parameters
+        ----------
+        - path: str = None, 树的路径,为None表示当前路径
+        - depth: int = None, 树的深度,为None表示不限制深度
+        - filter_: Callable[[Path], bool] = None, 过滤器函数,为None表示不执行过滤, \
+            workers大于1时在读取目录的线程中调用
+        - workers: int = None, 并发读取目录的线程数,为None表示逐个读取,用于NFS等高延迟文件系统
+        - stat: bool = False, 是否获取大小及修改时间
+        - exclude: list[str] = None, gitignore格式的排除模式,被排除的目录不再读取
+        - gitignore: bool = False, 是否按遍历到的.gitignore、.ignore文件忽略文件及目录
+
+        Returns
+        -------
+        - Iterator[TreeNode], 目录树节点
+        """
+        if path is None:
+            path = './'
+        path = Path(path)
+        root_stat = os.stat(path) if stat else None
+        yield TreeNode(
+            str(path),
+            path.absolute().name,
+            0,
+            'dir',
+            True,
+            None if root_stat is None else root_stat.st_size,
+            None if root_stat is None else root_stat.st_mtime,
+        )
+        matcher = IgnoreMatcher(os.fspath(path), exclude, gitignore) if exclude or gitignore else None
+        lister = DirLister(lambda p: self._scandir(p, filter_, matcher), workers)
+        try:
+            # 栈中每层为(目录项, 下一个目录项的序号, 剩余深度)
+            stack = [(self._listdir(lister, path, depth), 0, depth)]
+            while stack:
+                entries, i, depth = stack[-1]
+                if i == len(entries):
+                    stack.pop()
+                    continue
+                stack[-1] = (entries, i + 1, depth)
+                entry = entries[i]
+                is_dir = entry.is_dir()
+                entry_stat = entry.stat() if stat else None
+                yield TreeNode(
+                    entry.path,
+                    entry.name,
+                    len(stack),
+                    'dir' if is_dir else 'file',
+                    i == len(entries) - 1,
+                    None if entry_stat is None else entry_stat.st_size,
+                    None if entry_stat is None else entry_stat.st_mtime,
+                )
+                if is_dir and (depth is None or (depth and depth > 1)):
+                    child_depth = None if depth is None else depth - 1
+                    stack.append((self._listdir(lister, entry.path, child_depth), 0, child_depth))
+        finally:
+            lister.close()
+
+    def _scan_sizes(self, path: str, snapshot: dict[str, list]) -> DirListing:
+        """
+        ~:读取目录的子目录及文件大小,目录修改时间与快照一致时直接使用快照,不再读取目录
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = snapshot.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return DirListing(path, mtime_ns, cached[1], [tuple(f) for f in cached[2]])
+        dirs: list[str] = []
+        files: list[tuple[str, int]] = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    files.append((entry.name, entry.stat().st_size))
+        return DirListing(path, mtime_ns, dirs, files)
+
+    def iter_du(
         self,
-        path: Path = None,
+        path: str = None,
         depth: int = None,
-        indent: str = " ",
-        is_last: bool = True,
         filter_: Callable[[Path], bool] = None,
-    ):
-        '''
-        ~:递归打印目录树方法
-        '''
-        entries: list[Path] = list(filter(filter_, Path(path).iterdir()))
-        dirs = [e for e in entries if e.is_dir()]
-        files = [e for e in entries if e.is_file()]
-        # 合并目录和文件，目录在前，文件在后
-        entries = dirs + files
-        total_entries = len(entries)
-        total_entries = len(entries)
-        for i, entry in enumerate(entries):
-            is_dir = entry.is_dir()
-            entry_name = entry.name
-
-            if i == total_entries - 1:
+        workers: int = None,
+        sort_by_size: bool = False,
+        index_path: str = None,
+        exclude: list[str] = None,
+        gitignore: bool = False,
+    ) -> Iterator[TreeNode]:
+        """
+        ~:du模式,一次遍历统计每个目录的大小及文件数,遍历完成后按输出顺序生成目录树节点, \
+            整棵树的节点保存在内存中
+
+        保存快照索引后,再次统计时只重新读取修改时间变化的目录,其余目录直接使用快照; \
+            目录的修改时间只在其中增删、重命名文件时变化,文件内容原地修改导致的大小变化不会被发现, \
+            需要准确结果时删除快照重新统计
+
+        Parameters
+        ----------
+        - path: str = None, 树的路径,为None表示当前路径
+        - depth: int = None, 输出的深度,为None表示不限制深度,大小总是统计所有层
+        - filter_: Callable[[Path], bool] = None, 过滤器函数,为None表示不执行过滤, \
+            被过滤的文件及目录不计入大小
+        - workers: int = None, 并发读取目录的线程数,为None表示逐个读取
+        - sort_by_size: bool = False, 是否按大小降序排列(目录在前,文件在后)
+        - index_path: str = None, 快照索引文件路径,为None表示不使用快照
+        - exclude: list[str] = None, gitignore格式的排除模式,被排除的文件及目录不计入大小
+        - gitignore: bool = False, 是否按遍历到的.gitignore、.ignore文件忽略文件及目录
+
+        Returns
+        -------
+        - Iterator[TreeNode], 目录树节点,size为大小,count为文件数
+        """
+        if path is None:
+            path = './'
+        path = Path(path)
+        root_path = os.fspath(path)
+        snapshot: dict[str, list] = {}
+        if index_path is not None and os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                data = json.load(f)
+            # 快照与统计的目录不一致时不使用
+            if data.get('root') == str(path.absolute()):
+                snapshot = data['dirs']
+
+        matcher = IgnoreMatcher(root_path, exclude, gitignore) if exclude or gitignore else None
+
+        def scan(p: str) -> DirListing:
+            listing = self._scan_sizes(p, snapshot)
+            if matcher is not None:
+                matcher.enter(p, {name for name, _ in listing.files})
+            return listing
+
+        def keep(child: str, is_dir: bool) -> bool:
+            if filter_ is not None and not filter_(Path(child)):
+                return False
+            return matcher is None or not matcher.ignored(
+                matcher.enter(os.path.dirname(child), ()), child, is_dir
+            )
+
+        lister = DirLister(
+            scan,
+            workers,
+            subdirs=lambda listing: [
+                child
+                for name in listing.dirs
+                if keep(child := os.path.join(listing.path, name), True)
+            ],
+        )
+        index: dict[str, list] = {}
+        root = DuNode(root_path, path.absolute().name, 'dir')
+        # 按访问顺序记录目录,倒序汇总时子目录总在父目录之前
+        order: list[DuNode] = []
+        stack = [root]
+        try:
+            while stack:
+                node = stack.pop()
+                order.append(node)
+                listing = lister.get(node.path)
+                lister.prefetch(listing)
+                index[node.path] = [listing.mtime_ns, listing.dirs, listing.files]
+                for name in listing.dirs:
+                    if keep(child := os.path.join(node.path, name), True):
+                        node.children.append(DuNode(child, name, 'dir'))
+                stack.extend(reversed(node.children))
+                for name, size in listing.files:
+                    if keep(child := os.path.join(node.path, name), False):
+                        node.children.append(DuNode(child, name, 'file', size, 1))
+                        node.size += size
+                        node.count += 1
+        finally:
+            lister.close()
+        for node in reversed(order):
+            for child in node.children:
+                if child.kind == 'dir':
+                    node.size += child.size
+                    node.count += child.count
+            if sort_by_size:
+                node.children.sort(key=lambda c: (c.kind != 'dir', -c.size))
+        if index_path is not None:
+            tmp_path = f'{index_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'root': str(path.absolute()), 'dirs': index}, f)
+            os.replace(tmp_path, index_path)
+
+        yield TreeNode(root.path, root.name, 0, 'dir', True, root.size, None, root.count)
+        # 栈中每层为(子节点, 下一个子节点的序号, 剩余深度)
+        frames = [(root.children, 0, depth)]
+        while frames:
+            children, i, depth = frames[-1]
+            if i == len(children):
+                frames.pop()
+                continue
+            frames[-1] = (children, i + 1, depth)
+            node = children[i]
+            yield TreeNode(
+                node.path,
+                node.name,
+                len(frames),
+                node.kind,
+                i == len(children) - 1,
+                node.size,
+                None,
+                node.count,
+            )
+            if node.kind == 'dir' and (depth is None or (depth and depth > 1)):
+                frames.append((node.children, 0, None if depth is None else depth - 1))
+
+    @staticmethod
+    def format_size(size: int) -> str:
+        """
+        ~:可读的大小,如`1.5M`
+        """
+        for unit in ('B', 'K', 'M', 'G', 'T'):
+            if size < 1024 or unit == 'T':
+                return f'{size}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+            size /= 1024
+
+    def _du_suffix(self, node: TreeNode) -> str:
+        if node.count is None:
+            return ''
+        if node.kind == 'dir':
+            return f' {self.GREY}[{self.format_size(node.size)}, {node.count}个文件]{self.WHITE}'
+        return f' {self.GREY}[{self.format_size(node.size)}]{self.WHITE}'
+
+    def _render_text(self, nodes: Iterable[TreeNode]) -> Iterator[str]:
+        """
+        ~:渲染文本目录树
+
+        Returns
+        -------
+        - Iterator[str], 每行文本
+        """
+        # 各层的缩进,以及各层目录是否为上一层的最后一项
+        indents = {1: ' '}
+        dir_last = {0: True}
+        for node in nodes:
+            if node.depth == 0:
+                yield f'{self.root_icon}{self.YELLOW}{node.name}{self.WHITE}{self._du_suffix(node)}\n'
+                continue
+            indent = indents[node.depth]
+            if node.is_last:
                 pre_branch = f"{self.branch[1]} "
                 new_indent = (
-                    indent + "    " if is_last else indent + f"{self.branch[0]}   "
+                    indent + "    "
+                    if dir_last[node.depth - 1]
+                    else indent + f"{self.branch[0]}   "
                 )
             else:
                 pre_branch = f"{self.branch[2]} "
                 new_indent = indent + f"{self.branch[0]}   "
 
-            if is_dir:
-                print(
-                    f"{indent}{pre_branch}{self.dir_icon}{self.BLUE}{entry_name}{self.WHITE}"
+            if node.kind == 'dir':
+                indents[node.depth + 1] = new_indent
+                dir_last[node.depth] = node.is_last
+                yield (
+                    f"{indent}{pre_branch}{self.dir_icon}{self.BLUE}{node.name}{self.WHITE}"
+                    f"{self._du_suffix(node)}\n"
                 )
-                if depth is None or (depth and depth > 1):
-                    self._print_tree(
-                        path=entry,
-                        depth=None if depth is None else depth - 1,
-                        indent=new_indent,
-                        is_last=(i == total_entries - 1),
-                        filter_=filter_,
-                    )
             else:
-                print(f"{indent}{pre_branch}{self.file_icon}{entry_name}")
+                yield f"{indent}{pre_branch}{self.file_icon}{node.name}{self._du_suffix(node)}\n"
+
+    def _write(self, lines: Iterable[str]):
+        """
+        ~:输出先写入缓冲区再批量写入标准输出
+        """
+        buffer: list[str] = []
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) >= self.buffer_lines:
+                sys.stdout.write(''.join(buffer))
+                buffer.clear()
+        sys.stdout.write(''.join(buffer))
+        sys.stdout.flush()
 
     def print_tree(
         self,
@@ -74,6 +678,14 @@ class Tree:
         depth: int = None,
         bold: bool = True,
         filter_: Callable[[Path], bool] = None,
+        workers: int = None,
+        format_: str = 'text',
+        stat: bool = False,
+        du: bool = False,
+        sort_by_size: bool = False,
+        index_path: str = None,
+        exclude: list[str] = None,
+        gitignore: bool = False,
     ) -> None:
         """
         ~:打印树结构
@@ -83,30 +695,70 @@ class Tree:
         - path: str = None, 树的路径,为None表示当前路径
         - depth: int = None, 树的深度,为None表示不限制深度
         - bold: bool = True, 是否加粗显示
-        - filter_: Callable[[Path], bool] = None, 过滤器函数,为None表示不执行过滤
+        - filter_: Callable[[Path], bool] = None, 过滤器函数,为None表示不执行过滤, \
+            workers大于1时在读取目录的线程中调用
+        - workers: int = None, 并发读取目录的线程数,为None表示逐个读取,用于NFS等高延迟文件系统
+        - format_: str = 'text', 输出格式,text为文本目录树,ndjson为每行一个节点的json, \
+            json为节点数组,节点字段见TreeNode
+        - stat: bool = False, ndjson、json格式是否输出大小及修改时间
+        - du: bool = False, 是否统计并显示每个目录的大小及文件数,见iter_du
+        - sort_by_size: bool = False, du模式下是否按大小降序排列
+        - index_path: str = None, du模式的快照索引文件路径,为None表示不使用快照
+        - exclude: list[str] = None, gitignore格式的排除模式,如`['.git/', 'node_modules/']`, \
+            被排除的目录不再读取
+        - gitignore: bool = False, 是否按遍历到的.gitignore、.ignore文件忽略文件及目录
 
         Returns
         -------
         - None
         """
-
-        if path is None:
-            path = './'
-        self.path = Path(path)
+        if format_ not in self.formats:
+            raise ValueError(f'format_只能是{self.formats}之一')
         if bold:
             self.branch = Tree.branch_bold
         else:
             self.branch = Tree.branch
+        if du:
+            nodes = self.iter_du(
+                path=path,
+                depth=depth,
+                filter_=filter_,
+                workers=workers,
+                sort_by_size=sort_by_size,
+                index_path=index_path,
+                exclude=exclude,
+                gitignore=gitignore,
+            )
+        else:
+            nodes = self.iter_tree(
+                path=path,
+                depth=depth,
+                filter_=filter_,
+                workers=workers,
+                stat=stat and format_ != 'text',
+                exclude=exclude,
+                gitignore=gitignore,
+            )
+        self.path = Path('./' if path is None else path)
+
+        if format_ == 'text':
+            self._write(self._render_text(nodes))
+        else:
+            lines = (json.dumps(node._asdict(), ensure_ascii=False) for node in nodes)
+            if format_ == 'ndjson':
+                self._write(f'{line}\n' for line in lines)
+            else:
+                self._write(_json_array(lines))
 
-        print(f'{self.root_icon}{self.YELLOW}{self.path.absolute().name}{self.WHITE}')
 
-        self._print_tree(
-            path=self.path,
-            depth=depth,
-            indent=' ',
-            is_last=True,
-            filter_=filter_,
-        )
+def _json_array(lines: Iterable[str]) -> Iterator[str]:
+    """
+    ~:逐个输出json数组元素
+    """
+    yield '['
+    for i, line in enumerate(lines):
+        yield f'\n{line}' if i == 0 else f',\n{line}'
+    yield '\n]\n'
 
 
 def shell():
@@ -120,12 +772,34 @@ def shell():
     )
     parser.add_argument("-d", "--depth", type=int, help="限制显示的层数")
     parser.add_argument("--bold_off", action="store_false", help="关闭粗体分支")
+    parser.add_argument("-j", "--workers", type=int, help="并发读取目录的线程数")
+    parser.add_argument(
+        "-f", "--format", choices=Tree.formats, default='text', help="输出格式"
+    )
+    parser.add_argument("-s", "--stat", action="store_true", help="ndjson、json格式输出大小及修改时间")
+    parser.add_argument("--du", action="store_true", help="统计每个目录的大小及文件数")
+    parser.add_argument("--sort", action="store_true", help="du模式下按大小降序排列")
+    parser.add_argument("--index", type=str, help="du模式的快照索引文件路径")
+    parser.add_argument(
+        "-e", "--exclude", action="append", help="排除的模式(gitignore格式),可多次指定"
+    )
+    parser.add_argument(
+        "-g", "--gitignore", action="store_true", help="按.gitignore、.ignore文件忽略文件及目录"
+    )
     args = parser.parse_args()
     tree = Tree()
     tree.print_tree(
         path=args.path,
         depth=args.depth,
         bold=args.bold_off,
+        workers=args.workers,
+        format_=args.format,
+        stat=args.stat,
+        du=args.du,
+        sort_by_size=args.sort,
+        index_path=args.index,
+        exclude=args.exclude,
+        gitignore=args.gitignore,
     )
 
 
@@ -135,7 +809,7 @@ if __name__ == '__main__':
         path='./',
         depth=3,
         bold=True,
-        filter_=lambda path: not str(path).endswith('.git'),
+        exclude=['.git/'],
     )
 
     ...
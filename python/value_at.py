@@ -9,12 +9,20 @@
 
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Iterable
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Literal
 
+import numpy as np
 import pandas as pd
 
-__all__ = ['get_decimal_places', 'values_at']
+__all__ = [
+    'get_decimal_places',
+    'values_at',
+    'BinAggregator',
+    'bin_chunks',
+    'bin_csv',
+    'bin_parquet',
+]
 
 
 def get_decimal_places(number: float) -> int:
@@ -34,6 +42,127 @@ def get_decimal_places(number: float) -> int:
     return decimal_places
 
 
+def _bin_numbers(
+    values: np.ndarray,
+    interval_size: float,
+    label_point: float = 0,
+    label_loc: float = 0.5,
+) -> np.ndarray:
+    '''
+    ~:数字所在区间的标签,数字数组向量化计算,nan保持为nan
+
+    Parameters
+    ----------
+    - values: np.ndarray, 数字数组
+    - interval_size: float, 区间大小
+    - label_point: float = 0, 可存在的标签点
+    - label_loc: float = 0.5, 标签点在区间的位置
+
+    Returns
+    -------
+    - np.ndarray, 整数输入且区间参数都为整数时为整数数组,否则为float64数组
+    '''
+    values = np.asarray(values)
+    if values.dtype.kind not in 'iuf':
+        values = values.astype(np.float64)
+    bins = (
+        np.floor_divide(values - label_point + interval_size * label_loc, interval_size)
+        * interval_size
+        + label_point
+    )
+    decimals = max(
+        get_decimal_places(interval_size * label_loc), get_decimal_places(label_point)
+    )
+    return np.round(bins, decimals)
+
+
+def _bin_nanoseconds(
+    values: np.ndarray,
+    interval_size: int,
+    label_point: int = 0,
+    label_loc: float = 0,
+) -> np.ndarray:
+    '''
+    ~:时间(int64纳秒)所在区间的标签,整数向量化计算,没有浮点误差,NaT保持为NaT
+
+    Parameters
+    ----------
+    - values: np.ndarray, int64纳秒数组,NaT为int64最小值
+    - interval_size: int, 区间大小,纳秒
+    - label_point: int = 0, 可存在的标签点,纳秒
+    - label_loc: float = 0, 标签点在区间的位置
+
+    Returns
+    -------
+    - np.ndarray, int64纳秒数组
+    '''
+    values = np.asarray(values, dtype=np.int64)
+    nat = np.iinfo(np.int64).min
+    offset = round(interval_size * label_loc)
+    bins = (values - label_point + offset) // interval_size * interval_size + label_point
+    return np.where(values == nat, nat, bins)
+
+
+def _bin_times(
+    values: pd.Series,
+    interval_size: str | pd.Timedelta,
+    label_point: str | pd.Timestamp | pd.Timedelta = 0,
+    label_loc: float = 0,
+    format: str = None,
+) -> np.ndarray | pd.api.extensions.ExtensionArray:
+    '''
+    ~:时间或时间间隔所在区间的标签,带时区的时间按当地时间分区间,标签再转换回原时区, \
+        夏令时重叠的标签取与原时间相同的UTC偏移
+
+    Returns
+    -------
+    - np.ndarray | pd.api.extensions.ExtensionArray, datetime64[ns]/timedelta64[ns]数组, \
+        带时区时为带时区的DatetimeArray
+    '''
+    size = pd.Timedelta(interval_size).value
+    if _is_timedelta(values):
+        nanoseconds = pd.to_timedelta(values).to_numpy(dtype='timedelta64[ns]')
+        return _bin_nanoseconds(
+            nanoseconds.view(np.int64), size, pd.Timedelta(label_point).value, label_loc
+        ).view('timedelta64[ns]')
+    times = pd.to_datetime(values, format=format)
+    tz = times.dt.tz
+    label_point = pd.Timestamp(label_point)
+    if tz is not None:
+        if label_point.tz is not None:
+            label_point = label_point.tz_convert(tz).tz_localize(None)
+        # 当地时间与UTC时间之差,用于确定夏令时重叠时标签的UTC偏移
+        utc = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        times = times.dt.tz_localize(None)
+    wall = times.to_numpy(dtype='datetime64[ns]').view(np.int64)
+    labels = _bin_nanoseconds(wall, size, label_point.value, label_loc).view(
+        'datetime64[ns]'
+    )
+    if tz is None:
+        return labels
+    labels = pd.Series(labels)
+    dst_labels = labels.dt.tz_localize(
+        tz, ambiguous=np.ones(len(labels), dtype=bool), nonexistent='shift_forward'
+    )
+    dst_offsets = labels.to_numpy().view(np.int64) - dst_labels.to_numpy(
+        dtype='datetime64[ns]'
+    ).view(np.int64)
+    return labels.dt.tz_localize(
+        tz, ambiguous=dst_offsets == wall - utc, nonexistent='shift_forward'
+    ).array
+
+
+def _is_timedelta(values: pd.Series) -> bool:
+    '''
+    ~:按数据类型(或第一个元素的类型)判断是否为时间间隔
+    '''
+    if values.dtype.kind == 'm':
+        return True
+    return values.dtype.kind == 'O' and not values.empty and isinstance(
+        values.iloc[0], (timedelta, np.timedelta64)
+    )
+
+
 def values_at(
     values: float | pd.Timestamp | Iterable[float | pd.Timestamp],
     interval_size: float | pd.Timedelta,
@@ -41,10 +170,15 @@ def values_at(
     is_time: bool = None,
     label_loc: float = None,
     format: str = None,
-) -> float | pd.Timestamp | list[float | pd.Timestamp]:
+    output: Literal['list', 'ndarray', 'series', 'index'] = 'list',
+) -> float | pd.Timestamp | list[float | pd.Timestamp] | np.ndarray | pd.Series | pd.Index:
     '''
     ~:获取值(数字或时间)所在区间
 
+    数字转换为数字数组,时间转换为int64纳秒数组后向量化计算,没有逐个元素的python调用, \
+        时间精确到纳秒;带时区的时间按当地时间分区间,返回相同时区的标签; \
+        时间间隔(pd.Timedelta)按相对于0的时长分区间
+
     Parameters
     ----------
     - values: float | pd.Timestamp | Iterable[float | pd.Timestamp], 值或值迭代对象
@@ -53,56 +187,316 @@ def values_at(
     - is_time: bool = None, 是否为时间类型,默认自动判断
     - label_loc: float = None, 标签点在区间的位置,为`None`时数字为`0.5`,时间为`0`
     - format: str = None, 时间格式
+    - output: Literal['list', 'ndarray', 'series', 'index'] = 'list', 值为迭代对象时的返回类型, \
+        ndarray为数字或datetime64[ns]数组(带时区时为Timestamp对象数组), \
+        series保留输入Series的索引,index为Index或DatetimeIndex
 
     Returns
     -------
-    - float | pd.Timestamp | list[float | pd.Timestamp], 值所在区间
+    - float | pd.Timestamp | list[float | pd.Timestamp] | np.ndarray | pd.Series | pd.Index, 值所在区间
     '''
+    if output not in ('list', 'ndarray', 'series', 'index'):
+        raise ValueError(f'不支持的返回类型: {output}')
     if isinstance(values, str):
         iterable_ = False
     else:
         iterable_ = isinstance(values, Iterable)
-
+    if not iterable_:
+        values = [values]
+    index = values.index if isinstance(values, pd.Series) else None
     values = pd.Series(values).reset_index(drop=True)
 
-    if values.shape[0] > 0:
-        if is_time is None:
-            if isinstance(values.iloc[0], (str, pd.Timedelta, datetime)):
-                is_time = True
-            else:
-                is_time = False
-    else:
-        return values.to_list()
-
+    if is_time is None:
+        is_time = values.dtype.kind in 'Mm' or (
+            not values.empty
+            and isinstance(
+                values.iloc[0],
+                (str, datetime, timedelta, np.datetime64, np.timedelta64),
+            )
+        )
     if label_point is None:
         label_point = 0
     if label_loc is None:
-        if is_time:
-            label_loc = 0
-        else:
-            label_loc = 0.5
+        label_loc = 0 if is_time else 0.5
     if is_time:
-        values = (pd.to_datetime(values, format=format) - pd.to_datetime(0)).apply(
-            pd.Timedelta.total_seconds
+        result = _bin_times(values, interval_size, label_point, label_loc, format)
+    else:
+        result = _bin_numbers(values, interval_size, label_point, label_loc)
+
+    if not iterable_:
+        return pd.Series(result).to_list()[0]
+    if output == 'ndarray':
+        return np.asarray(result)
+    if output == 'series':
+        return pd.Series(result, index=index)
+    if output == 'index':
+        return pd.Index(result)
+    return pd.Series(result).to_list()
+
+
+class BinAggregator:
+    """
+    流式分区间聚合,逐块计算值所在区间并累加每个区间的count/sum/min/max, \
+        内存只与区间数有关,与行数无关
+    """
+
+    def __init__(
+        self,
+        interval_size: float | pd.Timedelta,
+        label_point: float | pd.Timestamp = None,
+        is_time: bool = None,
+        label_loc: float = None,
+        format: str = None,
+    ):
+        '''
+        Parameters
+        ----------
+        - interval_size: float | pd.Timedelta, 区间大小
+        - label_point: float | pd.Timestamp = None, 可存在的标签点
+        - is_time: bool = None, 是否为时间类型,默认按第一块自动判断
+        - label_loc: float = None, 标签点在区间的位置,为`None`时数字为`0.5`,时间为`0`
+        - format: str = None, 时间格式
+        '''
+        self.interval_size = interval_size
+        self.label_point = label_point
+        self.is_time = is_time
+        self.label_loc = label_loc
+        self.format = format
+        self.rows = 0
+        self._bins: pd.DataFrame = None
+
+    def update(
+        self,
+        values: Iterable[float | pd.Timestamp],
+        metrics: Iterable[float] = None,
+    ) -> BinAggregator:
+        '''
+        ~:聚合一块数据
+
+        Parameters
+        ----------
+        - values: Iterable[float | pd.Timestamp], 用于分区间的值
+        - metrics: Iterable[float] = None, 被聚合的指标,与values等长,默认聚合values本身
+
+        Returns
+        -------
+        - BinAggregator, 自身
+        '''
+        values = pd.Series(values).reset_index(drop=True)
+        if values.empty:
+            return self
+        if self.is_time is None:
+            first = values.iloc[0]
+            self.is_time = values.dtype.kind in 'Mm' or isinstance(
+                first, (str, datetime, timedelta, np.datetime64, np.timedelta64)
+            )
+        labels = values_at(
+            values,
+            self.interval_size,
+            label_point=self.label_point,
+            is_time=self.is_time,
+            label_loc=self.label_loc,
+            format=self.format,
+            output='index',
+        )
+        if metrics is None:
+            if self.is_time:
+                raise ValueError('时间类型的值需要指定被聚合的指标')
+            metrics = values
+        metrics = np.asarray(metrics, dtype=np.float64)
+        if len(metrics) != len(labels):
+            raise ValueError(f'指标长度{len(metrics)}与值长度{len(labels)}不一致')
+        self.rows += len(labels)
+        chunk = (
+            pd.DataFrame({'bin': labels, 'metric': metrics})
+            .groupby('bin')['metric']
+            .agg(['count', 'sum', 'min', 'max'])
         )
-        interval_size = pd.to_timedelta(interval_size).total_seconds()
-        label_point = (pd.to_datetime(label_point) - pd.to_datetime(0)).total_seconds()
+        self._merge(chunk)
+        return self
 
-    values_at_: pd.Series | float = (
-        (values - label_point + interval_size * label_loc) // interval_size
-    ) * interval_size + label_point
+    def _merge(self, bins: pd.DataFrame):
+        '''
+        ~:合并已按区间分组的聚合结果
+        '''
+        if self._bins is None:
+            self._bins = bins
+            return
+        self._bins = (
+            pd.concat([self._bins, bins])
+            .groupby(level=0)
+            .agg({'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'})
+        )
 
-    decimal_list = []
-    # decimal_list.append(values.apply(get_decimal_places).max())
-    decimal_list.append(get_decimal_places(interval_size * label_loc))
-    decimal_list.append(get_decimal_places(label_point))
+    def merge(self, other: BinAggregator) -> BinAggregator:
+        '''
+        ~:合并另一个聚合器(如并行处理的其他分片)的结果,两者分区间参数需要相同
 
-    values_at_ = values_at_.round(max(decimal_list))
-    if is_time:
-        values_at_ = pd.to_datetime(values_at_, unit='s')
-    values_at_ = values_at_.to_list()
+        Returns
+        -------
+        - BinAggregator, 自身
+        '''
+        if other._bins is not None:
+            self._merge(other._bins)
+            self.rows += other.rows
+            if self.is_time is None:
+                self.is_time = other.is_time
+        return self
+
+    def result(self) -> pd.DataFrame:
+        '''
+        ~:当前聚合结果
+
+        Returns
+        -------
+        - pd.DataFrame, 以区间标签为索引(升序),列为count/sum/min/max/mean, \
+            count只统计非空指标
+        '''
+        if self._bins is None:
+            return pd.DataFrame(
+                columns=['count', 'sum', 'min', 'max', 'mean'], index=pd.Index([], name='bin')
+            )
+        bins = self._bins.sort_index()
+        bins['count'] = bins['count'].astype(np.int64)
+        bins['mean'] = bins['sum'] / bins['count'].where(bins['count'] > 0)
+        return bins
+
+
+def bin_chunks(
+    chunks: Iterable[Iterable[float | pd.Timestamp] | pd.DataFrame],
+    interval_size: float | pd.Timedelta,
+    column: str = None,
+    metric: str = None,
+    label_point: float | pd.Timestamp = None,
+    is_time: bool = None,
+    label_loc: float = None,
+    format: str = None,
+) -> pd.DataFrame:
+    '''
+    ~:从数据块迭代器流式分区间聚合
+
+    Parameters
+    ----------
+    - chunks: Iterable[Iterable[float | pd.Timestamp] | pd.DataFrame], 数据块迭代器, \
+        块为数组时聚合值本身,为DataFrame时按column分区间、聚合metric列
+    - interval_size: float | pd.Timedelta, 区间大小
+    - column: str = None, DataFrame块中用于分区间的列
+    - metric: str = None, DataFrame块中被聚合的列,默认聚合column列
+    - label_point: float | pd.Timestamp = None, 可存在的标签点
+    - is_time: bool = None, 是否为时间类型,默认自动判断
+    - label_loc: float = None, 标签点在区间的位置,为`None`时数字为`0.5`,时间为`0`
+    - format: str = None, 时间格式
+
+    Returns
+    -------
+    - pd.DataFrame, 见`BinAggregator.result`
+    '''
+    aggregator = BinAggregator(interval_size, label_point, is_time, label_loc, format)
+    for chunk in chunks:
+        if isinstance(chunk, pd.DataFrame):
+            if column is None:
+                raise ValueError('DataFrame数据块需要指定column')
+            aggregator.update(chunk[column], None if metric is None else chunk[metric])
+        else:
+            aggregator.update(chunk)
+    return aggregator.result()
 
-    return values_at_ if iterable_ else values_at_[0]
+
+def bin_csv(
+    path: str,
+    column: str,
+    interval_size: float | pd.Timedelta,
+    metric: str = None,
+    chunksize: int = 1_000_000,
+    label_point: float | pd.Timestamp = None,
+    is_time: bool = None,
+    label_loc: float = None,
+    format: str = None,
+    **kwargs,
+) -> pd.DataFrame:
+    '''
+    ~:分块读取CSV文件并流式分区间聚合,只读取用到的列
+
+    Parameters
+    ----------
+    - path: str, CSV文件路径
+    - column: str, 用于分区间的列
+    - interval_size: float | pd.Timedelta, 区间大小
+    - metric: str = None, 被聚合的列,默认聚合column列
+    - chunksize: int = 1_000_000, 每块行数
+    - label_point: float | pd.Timestamp = None, 可存在的标签点
+    - is_time: bool = None, 是否为时间类型,默认自动判断
+    - label_loc: float = None, 标签点在区间的位置,为`None`时数字为`0.5`,时间为`0`
+    - format: str = None, 时间格式
+    - kwargs: 传给`pd.read_csv`的其他参数
+
+    Returns
+    -------
+    - pd.DataFrame, 见`BinAggregator.result`
+    '''
+    usecols = [column] if metric is None or metric == column else [column, metric]
+    with pd.read_csv(path, usecols=usecols, chunksize=chunksize, **kwargs) as reader:
+        return bin_chunks(
+            reader, interval_size, column, metric, label_point, is_time, label_loc, format
+        )
+
+
+def _iter_parquet(
+    path: str, columns: list[str], batch_size: int
+) -> Iterator[pd.DataFrame]:
+    '''
+    ~:按批读取Parquet文件的指定列
+    '''
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('分批读取Parquet文件需要安装pyarrow')
+    file = pq.ParquetFile(path)
+    for batch in file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def bin_parquet(
+    path: str,
+    column: str,
+    interval_size: float | pd.Timedelta,
+    metric: str = None,
+    batch_size: int = 1_000_000,
+    label_point: float | pd.Timestamp = None,
+    is_time: bool = None,
+    label_loc: float = None,
+    format: str = None,
+) -> pd.DataFrame:
+    '''
+    ~:分批读取Parquet文件并流式分区间聚合,只读取用到的列,需要安装pyarrow
+
+    Parameters
+    ----------
+    - path: str, Parquet文件路径
+    - column: str, 用于分区间的列
+    - interval_size: float | pd.Timedelta, 区间大小
+    - metric: str = None, 被聚合的列,默认聚合column列
+    - batch_size: int = 1_000_000, 每批行数
+    - label_point: float | pd.Timestamp = None, 可存在的标签点
+    - is_time: bool = None, 是否为时间类型,默认自动判断
+    - label_loc: float = None, 标签点在区间的位置,为`None`时数字为`0.5`,时间为`0`
+    - format: str = None, 时间格式
+
+    Returns
+    -------
+    - pd.DataFrame, 见`BinAggregator.result`
+    '''
+    columns = [column] if metric is None or metric == column else [column, metric]
+    return bin_chunks(
+        _iter_parquet(path, columns, batch_size),
+        interval_size,
+        column,
+        metric,
+        label_point,
+        is_time,
+        label_loc,
+        format,
+    )
 
 
 if __name__ == '__main__':
@@ -120,3 +514,7 @@ if __name__ == '__main__':
         label_loc=0.5,
     )
     print(values_at_)
+    aggregator = BinAggregator(0.5)
+    for chunk in ([2.54, 2.3, 2.56], [2.04, 2.06]):
+        aggregator.update(chunk)
+    print(aggregator.result())